@@ -2,7 +2,7 @@ import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from shared.router import router
-from shared.storage import MinIOStorage
+from shared.storage import get_storage
 
 app = FastAPI(
     title="Video Transcoding API",
@@ -22,7 +22,7 @@ app.add_middleware(
 # Initialize MinIO buckets on startup
 @app.on_event("startup")
 async def startup_event():
-    storage = MinIOStorage()
+    get_storage()
     print("✓ MinIO buckets initialized")
     print(f"✓ API Server ready at http://localhost:8000")
     print(f"✓ Temporal address: {os.getenv('TEMPORAL_ADDRESS', 'localhost:7233')}")
@@ -14,15 +14,15 @@ import tempfile
 from fastapi import APIRouter, UploadFile, File, HTTPException
 from pydantic import BaseModel
 from temporalio.client import Client
-from shared.storage import MinIOStorage
+from shared.storage import get_storage
 from shared.workflows import VideoWorkflow
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/videos", tags=["videos"])
 
-# Initialize MinIO storage
-storage = MinIOStorage()
+# Shared MinIO storage (one client and connection pool per process)
+storage = get_storage()
 
 # Temporal client (will be initialized on first use)
 temporal_client = None
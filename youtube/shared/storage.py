@@ -1,9 +1,12 @@
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 import os
 import uuid
 import logging
 import json
+import threading
 from datetime import datetime
 from io import BytesIO
 
@@ -12,6 +15,49 @@ from io import BytesIO
 logger = logging.getLogger(__name__)
 
 
+# HTTP connection pool size; must cover concurrent transfers from activity thread pools
+MAX_POOL_CONNECTIONS = 32
+
+# Retry transient errors (connection resets, 5xx, throttling) with backoff on
+# the pooled connections instead of failing the whole activity attempt
+CLIENT_RETRIES = {"max_attempts": 3, "mode": "standard"}
+
+def env_int(name: str, default: int, minimum: int) -> int:
+    """
+    Read an integer setting from the environment, clamped to a minimum.
+    
+    Invalid values fall back to the default (with a warning) instead of
+    crashing every process that imports this module.
+    """
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        logger.warning(f"Invalid {name}={raw!r}, using {default}")
+        return default
+    if value < minimum:
+        logger.warning(f"{name}={value} is below the minimum, using {minimum}")
+        return minimum
+    return value
+
+
+# Multipart transfer settings: objects above the threshold are streamed in
+# TRANSFER_PART_SIZE_MB parts (16 MB), TRANSFER_MAX_CONCURRENCY (4) in flight
+# per object. Pipe uploads buffer each in-flight part, so memory per transfer
+# is part size x concurrency; raise both on hosts with fast links to MinIO.
+# S3/MinIO reject non-final multipart parts below 5 MiB.
+MIN_PART_SIZE_MB = 5
+TRANSFER_PART_SIZE = env_int("TRANSFER_PART_SIZE_MB", 16, MIN_PART_SIZE_MB) << 20
+TRANSFER_MAX_CONCURRENCY = env_int("TRANSFER_MAX_CONCURRENCY", 4, 1)
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=TRANSFER_PART_SIZE,
+    multipart_chunksize=TRANSFER_PART_SIZE,
+    max_concurrency=TRANSFER_MAX_CONCURRENCY,
+)
+
+
 # Storage path constants for consistent structure
 class StoragePaths:
     """
@@ -53,6 +99,11 @@ class StoragePaths:
         """Path to a transcoded HLS segment (.ts for streaming)."""
         return f"{video_id}/outputs/{resolution}/segments/seg_{segment_index:04d}.ts"
     
+    @staticmethod
+    def output_segments_prefix(video_id: str, resolution: str) -> str:
+        """Prefix under which all HLS segments of a resolution are stored."""
+        return f"{video_id}/outputs/{resolution}/segments/"
+    
     @staticmethod
     def output_manifest(video_id: str, resolution: str) -> str:
         """Path to output manifest for a resolution."""
@@ -140,7 +191,12 @@ class MinIOStorage:
             endpoint_url=self.endpoint_url,
             aws_access_key_id=self.access_key,
             aws_secret_access_key=self.secret_key,
-            region_name=region_name
+            region_name=region_name,
+            config=Config(max_pool_connections=MAX_POOL_CONNECTIONS, retries=CLIENT_RETRIES)
+        )
+        logger.info(
+            f"Multipart transfers: {TRANSFER_PART_SIZE >> 20} MB parts, "
+            f"{TRANSFER_MAX_CONCURRENCY} in flight per object"
         )
         
         # Auto-create required buckets on initialization
@@ -155,6 +211,42 @@ class MinIOStorage:
         except ClientError:
             return False
     
+    def get_object_size(self, bucket_name: str, object_name: str) -> int:
+        """Get object size in bytes (HEAD request), or None if it does not exist"""
+        try:
+            response = self.s3_client.head_object(Bucket=bucket_name, Key=object_name)
+            return response['ContentLength']
+        except ClientError:
+            return None
+    
+    def get_object_range(self, bucket_name: str, object_name: str, offset: int, length: int) -> tuple:
+        """
+        Read a byte range of an object (ranged GET, no full download)
+        
+        Args:
+            bucket_name: Name of the bucket
+            object_name: Name of the object in bucket
+            offset: First byte to read
+            length: Number of bytes to read (fewer are returned at end of object)
+            
+        Returns:
+            Tuple of (data, total_object_size), or (None, None) on error
+        """
+        try:
+            response = self.s3_client.get_object(
+                Bucket=bucket_name,
+                Key=object_name,
+                Range=f"bytes={offset}-{offset + length - 1}"
+            )
+            data = response['Body'].read()
+            # Content-Range: "bytes <start>-<end>/<total>"
+            content_range = response.get('ContentRange', '')
+            total_size = int(content_range.rsplit('/', 1)[1]) if '/' in content_range else None
+            return data, total_size
+        except ClientError as e:
+            logger.error(f"Error reading range of '{bucket_name}/{object_name}': {e}")
+            return None, None
+    
     def upload_fileobj(self, file_data: bytes, bucket_name: str, object_name: str) -> bool:
         """
         Upload file data (bytes) directly to MinIO without saving to disk
@@ -169,13 +261,36 @@ class MinIOStorage:
         """
         try:
             file_obj = BytesIO(file_data)
-            self.s3_client.upload_fileobj(file_obj, bucket_name, object_name)
+            self.s3_client.upload_fileobj(file_obj, bucket_name, object_name, Config=TRANSFER_CONFIG)
             logger.info(f"File data uploaded to '{bucket_name}/{object_name}'")
             return True
         except ClientError as e:
             logger.error(f"Error uploading file data: {e}")
             return False
     
+    def upload_stream(self, stream, bucket_name: str, object_name: str) -> bool:
+        """
+        Upload from a readable stream (e.g. a subprocess pipe) to MinIO
+        
+        The stream does not need to be seekable or have a known length;
+        boto3 multipart-uploads parts as bytes arrive.
+        
+        Args:
+            stream: File-like object with a read() method
+            bucket_name: Name of the bucket
+            object_name: Name of the object in bucket
+            
+        Returns:
+            True if upload successful, False otherwise
+        """
+        try:
+            self.s3_client.upload_fileobj(stream, bucket_name, object_name, Config=TRANSFER_CONFIG)
+            logger.info(f"Stream uploaded to '{bucket_name}/{object_name}'")
+            return True
+        except ClientError as e:
+            logger.error(f"Error uploading stream: {e}")
+            return False
+    
     def ensure_buckets(self, buckets: list = None) -> None:
         """
         Ensure required buckets exist, create if missing
@@ -268,7 +383,7 @@ class MinIOStorage:
         video_id = self._generate_video_id()
         
         try:
-            self.s3_client.upload_file(file_path, bucket_name, video_id)
+            self.s3_client.upload_file(file_path, bucket_name, video_id, Config=TRANSFER_CONFIG)
             logger.info(f"Raw video uploaded to '{bucket_name}/{video_id}'")
             return video_id, True
         except ClientError as e:
@@ -298,7 +413,7 @@ class MinIOStorage:
                 object_name = os.path.basename(file_path)
         
         try:
-            self.s3_client.upload_file(file_path, bucket_name, object_name)
+            self.s3_client.upload_file(file_path, bucket_name, object_name, Config=TRANSFER_CONFIG)
             logger.info(f"File '{file_path}' uploaded to '{bucket_name}/{object_name}'")
             return True
         except ClientError as e:
@@ -318,7 +433,7 @@ class MinIOStorage:
             True if download successful, False otherwise
         """
         try:
-            self.s3_client.download_file(bucket_name, object_name, file_path)
+            self.s3_client.download_file(bucket_name, object_name, file_path, Config=TRANSFER_CONFIG)
             logger.info(f"File '{object_name}' downloaded from '{bucket_name}' to '{file_path}'")
             return True
         except ClientError as e:
@@ -337,10 +452,12 @@ class MinIOStorage:
             List of object names
         """
         try:
-            response = self.s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
-            if 'Contents' not in response:
-                return []
-            return [obj['Key'] for obj in response['Contents']]
+            # Paginate: a single list_objects_v2 call caps at 1000 keys
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            keys = []
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+                keys.extend(obj['Key'] for obj in page.get('Contents', []))
+            return keys
         except ClientError as e:
             logger.error(f"Error listing objects: {e}")
             return []
@@ -364,6 +481,40 @@ class MinIOStorage:
             logger.error(f"Error deleting file: {e}")
             return False
     
+    def delete_files(self, bucket_name: str, object_names: list) -> list:
+        """
+        Delete many files from MinIO using multi-object DELETE requests
+        
+        Args:
+            bucket_name: Name of the bucket
+            object_names: Names of the objects to delete
+            
+        Returns:
+            List of object names that could not be deleted (empty on full success)
+        """
+        failed = []
+        
+        # S3 multi-object delete accepts at most 1000 keys per request
+        for start in range(0, len(object_names), 1000):
+            batch = object_names[start:start + 1000]
+            try:
+                response = self.s3_client.delete_objects(
+                    Bucket=bucket_name,
+                    Delete={
+                        'Objects': [{'Key': name} for name in batch],
+                        'Quiet': True
+                    }
+                )
+                for error in response.get('Errors', []):
+                    logger.error(f"Error deleting '{error['Key']}': {error.get('Message')}")
+                    failed.append(error['Key'])
+            except ClientError as e:
+                logger.error(f"Error deleting files: {e}")
+                failed.extend(batch)
+        
+        logger.info(f"Deleted {len(object_names) - len(failed)}/{len(object_names)} files from '{bucket_name}'")
+        return failed
+    
     def get_object_url(self, bucket_name: str, object_name: str, expiration: int = 3600) -> str:
         """
         Generate a presigned URL for an object
@@ -386,3 +537,33 @@ class MinIOStorage:
         except ClientError as e:
             logger.error(f"Error generating URL: {e}")
             return None
+
+
+# Process-wide storage singleton (shared client + HTTP connection pool)
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> MinIOStorage:
+    """
+    Get the process-wide MinIOStorage instance.
+    
+    Purpose: Reuse one boto3 client (and its keep-alive connection pool) across
+             all activities running in a worker process.
+    Consumers: Worker activities (split, transcode, playlist, metadata, etc.).
+    Logic:
+      1. Return the cached instance if it exists
+      2. Otherwise create it under a lock (double-checked) so concurrent
+         first calls build exactly one client and ensure buckets once
+    
+    Returns:
+        Shared MinIOStorage instance
+    """
+    global _storage
+    
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = MinIOStorage()
+    
+    return _storage
@@ -39,7 +39,8 @@ with workflow.unsafe.imports_passed_through():
     from worker.activities.scene_detection import detect_scenes, generate_chapter_files
     from worker.activities.chunked_transcode import (
         split_video,
-        transcode_chunk,
+        transcode_chunk_multi,
+        split_and_transcode,
         generate_hls_playlist,
         generate_master_playlist,
     )
@@ -69,7 +70,7 @@ class WatermarkOptions:
 class ChapterOptions:
     """Configuration for scene detection and chapter generation."""
     enabled: bool = False
-    scene_threshold: float = 0.3        # Sensitivity (0.1-0.5, lower = more scenes)
+    scene_threshold: float = 0.35       # Sensitivity (0.1-0.6, lower = more scenes)
     min_duration: int = 30              # Minimum chapter duration in seconds
     detect_intro: bool = True           # Auto-detect intro sequences
     detect_outro: bool = True           # Auto-detect outro/credits
@@ -139,7 +140,11 @@ RESOLUTION_HEIGHTS = {
 VALID_RESOLUTIONS = set(RESOLUTION_HEIGHTS.keys())
 
 
-def determine_target_resolutions(source_height: int, requested: List[str] = None) -> List[str]:
+def determine_target_resolutions(
+    source_height: int,
+    requested: List[str] = None,
+    allow_source_height: bool = False
+) -> List[str]:
     """
     Determine which resolutions to transcode to.
     
@@ -147,10 +152,13 @@ def determine_target_resolutions(source_height: int, requested: List[str] = None
         1. Only downscale (never upscale)
         2. If user requested specific resolutions, use those (filtered to valid downscales)
         3. If no request, auto-detect all valid downscales
+        4. With allow_source_height, a requested resolution equal to the source
+           height is kept (served by stream copy, no encode)
     
     Args:
         source_height: Original video height in pixels
         requested: User-requested resolutions (optional)
+        allow_source_height: Keep requested resolutions matching the source height
         
     Returns:
         List of resolution names to transcode to
@@ -159,6 +167,7 @@ def determine_target_resolutions(source_height: int, requested: List[str] = None
         1080p source, no request -> ['720p', '480p', '320p']
         1080p source, ["720p"]   -> ['720p']
         720p source, ["1080p"]   -> [] (can't upscale)
+        720p source, ["720p"]    -> ['720p'] only with allow_source_height
         480p source, no request  -> ['320p']
     """
     if requested:
@@ -167,7 +176,7 @@ def determine_target_resolutions(source_height: int, requested: List[str] = None
         for res in requested:
             if res in VALID_RESOLUTIONS:
                 res_height = RESOLUTION_HEIGHTS[res]
-                if res_height < source_height:
+                if res_height < source_height or (allow_source_height and res_height == source_height):
                     valid.append(res)
         return sorted(valid, key=lambda x: -RESOLUTION_HEIGHTS[x])  # Highest first
     else:
@@ -179,6 +188,14 @@ def determine_target_resolutions(source_height: int, requested: List[str] = None
         return targets
 
 
+# Sources up to this size and duration use the fused split_and_transcode
+# activity (one decode, all resolutions) instead of split → chunk fan-out.
+# Longer videos always fan out: chunks transcode in parallel across workers,
+# while the fused path encodes the whole timeline on one.
+FUSED_TRANSCODE_MAX_BYTES = 100 * 1024 * 1024  # 100 MB
+FUSED_TRANSCODE_MAX_DURATION = 60  # seconds
+
+
 # ==================== Retry Policy ====================
 
 def get_retry_policy(max_attempts: int = 3) -> RetryPolicy:
@@ -217,7 +234,9 @@ class VideoWorkflow:
            - THUMBNAIL (conditional) → Generate preview image
            - SCENE DETECTION (conditional) → Find chapter boundaries
         4. SPLIT (required)     → Chunk video for parallel processing
-        5. TRANSCODE (parallel) → Convert chunks × resolutions
+        5. TRANSCODE (parallel) → One 1:N transcode per chunk (all resolutions)
+           (small sources: fused split+transcode in one activity; a failed
+           chunk is retried per resolution and incomplete resolutions dropped)
         6. PLAYLISTS (required) → Generate HLS m3u8 files
         7. CHAPTERS (conditional) → Generate chapter files
     
@@ -409,8 +428,29 @@ class VideoWorkflow:
                             })
         
         # ==================== STAGE 4: DETERMINE RESOLUTIONS ====================
-        target_resolutions = determine_target_resolutions(source_height, opts.target_resolutions)
-        
+        # An H.264 source without watermark can be served as-is at its own
+        # height: those renditions are stream-copied instead of re-encoded
+        can_passthrough = metadata.get("video_codec") == "h264" and not (
+            opts.watermark and opts.watermark.text
+        )
+        target_resolutions = determine_target_resolutions(
+            source_height, opts.target_resolutions, allow_source_height=can_passthrough
+        )
+        passthrough_resolutions = [
+            res for res in target_resolutions if RESOLUTION_HEIGHTS[res] == source_height
+        ]
+        # Renditions above the source height (or at it, when it cannot be
+        # stream-copied) are never encoded: an upscale costs a full encode and
+        # looks no better than the source
+        skipped_resolutions = [
+            res for res in opts.target_resolutions or [] if res not in target_resolutions
+        ]
+        if skipped_resolutions:
+            workflow.logger.info(
+                f"[{video_id}] Skipping requested resolutions {skipped_resolutions}: "
+                f"invalid or not encodable from the {source_height}p source"
+            )
+
         if not target_resolutions:
             workflow.logger.info(f"[{video_id}] No valid target resolutions, source is lowest")
             return {
@@ -426,123 +466,196 @@ class VideoWorkflow:
         
         workflow.logger.info(f"[{video_id}] Target resolutions: {target_resolutions}")
         
-        # ==================== STAGE 5: SPLIT VIDEO ====================
-        try:
-            workflow.logger.info(f"[{video_id}] Stage 5: Splitting video into chunks")
-            split_result = await workflow.execute_activity(
-                split_video,
-                args=[video_id, 4],  # 4 second chunks
-                start_to_close_timeout=timedelta(minutes=10),
-                task_queue="split-queue",
-                retry_policy=retry_policy,
-            )
-            chunks = split_result.get("chunks", [])
-            chunk_count = split_result.get("chunk_count", 0)
-            workflow.logger.info(f"[{video_id}] Split complete: {chunk_count} chunks")
-        except ActivityError as e:
-            workflow.logger.error(f"[{video_id}] Split failed: {e}")
-            return {
-                "success": False,
-                "video_id": video_id,
-                "stage": "split",
-                "error": str(e.cause),
-                "thumbnail": thumbnail_result,
-                "warnings": warnings if warnings else None,
-            }
-        
-        # ==================== STAGE 6: PARALLEL TRANSCODE ====================
         # Prepare watermark settings
         watermark_text = opts.watermark.text if opts.watermark else None
         watermark_position = opts.watermark.position if opts.watermark else "bottom-right"
         watermark_font_size = opts.watermark.font_size if opts.watermark else 24
         watermark_opacity = opts.watermark.opacity if opts.watermark else 0.5
         
-        # Create tasks for every (chunk, resolution) combination
-        transcode_tasks = []
+        # ==================== STAGE 5+6 (FUSED): SMALL VIDEOS ====================
+        # Small sources are decoded once and transcoded to every resolution in a
+        # single activity, skipping the chunk upload/download round-trip.
+        # On failure we fall back to the chunked path below.
+        fused_result = None
+        source_size = metadata.get("size_bytes") or 0
+        # Passthrough renditions need the chunked path (the fused path re-encodes all)
+        if (
+            0 < source_size <= FUSED_TRANSCODE_MAX_BYTES
+            and 0 < (video_duration or 0) <= FUSED_TRANSCODE_MAX_DURATION
+            and not passthrough_resolutions
+        ):
+            try:
+                workflow.logger.info(
+                    f"[{video_id}] Stage 5+6: Fused split+transcode "
+                    f"({source_size / 1024 / 1024:.1f} MB, {video_duration:.1f}s source)"
+                )
+                fused_result = await workflow.execute_activity(
+                    split_and_transcode,
+                    args=[
+                        video_id,
+                        target_resolutions,
+                        4,  # 4 second segments
+                        watermark_text,
+                        watermark_position,
+                        watermark_font_size,
+                        watermark_opacity
+                    ],
+                    start_to_close_timeout=timedelta(minutes=15),
+                    task_queue="transcode-queue",
+                    retry_policy=get_retry_policy(max_attempts=1),
+                )
+                chunk_count = fused_result.get("chunk_count", 0)
+                segment_durations = fused_result.get("segment_durations", [])
+                transcode_errors = []
+                workflow.logger.info(f"[{video_id}] Fused transcode complete: {chunk_count} segments")
+            except ActivityError as e:
+                workflow.logger.warning(
+                    f"[{video_id}] Fused transcode failed, falling back to chunked path: {e}"
+                )
+                fused_result = None
         
-        for resolution in target_resolutions:
-            for chunk in chunks:
-                task = workflow.execute_activity(
-                    transcode_chunk,
+        if fused_result is None:
+            # ==================== STAGE 5: SPLIT VIDEO ====================
+            try:
+                workflow.logger.info(f"[{video_id}] Stage 5: Splitting video into chunks")
+                split_result = await workflow.execute_activity(
+                    split_video,
+                    args=[video_id, 4],  # 4 second chunks
+                    start_to_close_timeout=timedelta(minutes=10),
+                    task_queue="split-queue",
+                    retry_policy=retry_policy,
+                )
+                chunks = split_result.get("chunks", [])
+                chunk_count = split_result.get("chunk_count", 0)
+                # Keyframe-aligned chunks vary in length; playlists need each one
+                segment_durations = [chunk["duration"] for chunk in chunks]
+                workflow.logger.info(f"[{video_id}] Split complete: {chunk_count} chunks")
+            except ActivityError as e:
+                workflow.logger.error(f"[{video_id}] Split failed: {e}")
+                return {
+                    "success": False,
+                    "video_id": video_id,
+                    "stage": "split",
+                    "error": str(e.cause),
+                    "thumbnail": thumbnail_result,
+                    "warnings": warnings if warnings else None,
+                }
+        
+            # ==================== STAGE 6: PARALLEL TRANSCODE ====================
+            # One task per chunk: each decodes its chunk once and encodes every
+            # target resolution (1:N), instead of one decode per resolution
+            def transcode(chunk: dict, resolutions: list):
+                return workflow.execute_activity(
+                    transcode_chunk_multi,
                     args=[
                         video_id,
                         chunk["index"],
-                        resolution,
                         chunk["key"],
+                        resolutions,
                         watermark_text,
                         watermark_position,
                         watermark_font_size,
-                        watermark_opacity
+                        watermark_opacity,
+                        passthrough_resolutions
                     ],
-                    start_to_close_timeout=timedelta(minutes=5),
+                    start_to_close_timeout=timedelta(minutes=5 * len(resolutions)),
                     task_queue="transcode-queue",
                     retry_policy=retry_policy,
                 )
-                transcode_tasks.append({
-                    "task": task,
-                    "resolution": resolution,
-                    "chunk_index": chunk["index"]
-                })
-        
-        total_tasks = len(transcode_tasks)
-        workflow.logger.info(
-            f"[{video_id}] Stage 6: Starting {total_tasks} parallel transcode tasks "
-            f"({chunk_count} chunks × {len(target_resolutions)} resolutions)"
-            + (f" with watermark" if watermark_text else "")
-        )
+            
+            transcode_tasks = [
+                {"task": transcode(chunk, target_resolutions), "chunk": chunk}
+                for chunk in chunks
+            ]
         
-        # Execute all transcode tasks in parallel
-        completed_tasks = await asyncio.gather(
-            *[t["task"] for t in transcode_tasks],
-            return_exceptions=True
-        )
+            total_tasks = len(transcode_tasks)
+            workflow.logger.info(
+                f"[{video_id}] Stage 6: Starting {total_tasks} parallel chunk transcodes "
+                f"({chunk_count} chunks × {len(target_resolutions)} resolutions, "
+                f"one decode per chunk)"
+                + (f" with watermark" if watermark_text else "")
+            )
         
-        # Process results
-        transcode_errors = []
-        successful_by_resolution = {res: 0 for res in target_resolutions}
+            # Execute all transcode tasks in parallel
+            completed_tasks = await asyncio.gather(
+                *[t["task"] for t in transcode_tasks],
+                return_exceptions=True
+            )
         
-        for i, task_info in enumerate(transcode_tasks):
-            result = completed_tasks[i]
-            if isinstance(result, Exception):
-                workflow.logger.error(
-                    f"[{video_id}] Chunk {task_info['chunk_index']} {task_info['resolution']} failed: {result}"
-                )
-                transcode_errors.append({
-                    "resolution": task_info["resolution"],
-                    "chunk_index": task_info["chunk_index"],
-                    "error": str(result),
-                })
-            else:
-                successful_by_resolution[task_info["resolution"]] += 1
+            # Count finished renditions; one ffmpeg fails all of a chunk's outputs
+            # together, so a failed chunk is retried one resolution at a time to
+            # find out which renditions actually can't be produced
+            successful_by_resolution = {res: 0 for res in target_resolutions}
+            failed_chunks = []
         
-        workflow.logger.info(
-            f"[{video_id}] Transcode complete: "
-            f"{total_tasks - len(transcode_errors)} succeeded, {len(transcode_errors)} failed"
-        )
+            for i, task_info in enumerate(transcode_tasks):
+                result = completed_tasks[i]
+                if isinstance(result, Exception):
+                    workflow.logger.warning(
+                        f"[{video_id}] Chunk {task_info['chunk']['index']} failed, "
+                        f"retrying per resolution: {result}"
+                    )
+                    failed_chunks.append(task_info["chunk"])
+                else:
+                    for rendition in result["results"]:
+                        successful_by_resolution[rendition["resolution"]] += 1
         
-        # Check if any resolution has all chunks transcoded
-        if transcode_errors:
-            complete_resolutions = [
-                res for res, count in successful_by_resolution.items()
-                if count == chunk_count
+            fallback_tasks = [
+                {"task": transcode(chunk, [resolution]), "chunk_index": chunk["index"], "resolution": resolution}
+                for chunk in failed_chunks
+                for resolution in target_resolutions
             ]
+            fallback_results = await asyncio.gather(
+                *[t["task"] for t in fallback_tasks],
+                return_exceptions=True
+            )
+        
+            transcode_errors = []
+            for i, task_info in enumerate(fallback_tasks):
+                result = fallback_results[i]
+                if isinstance(result, Exception):
+                    workflow.logger.error(
+                        f"[{video_id}] Chunk {task_info['chunk_index']} "
+                        f"{task_info['resolution']} failed: {result}"
+                    )
+                    transcode_errors.append({
+                        "resolution": task_info["resolution"],
+                        "chunk_index": task_info["chunk_index"],
+                        "error": str(result),
+                    })
+                else:
+                    successful_by_resolution[task_info["resolution"]] += 1
+        
+            workflow.logger.info(
+                f"[{video_id}] Transcode complete: "
+                f"{total_tasks - len(failed_chunks)} chunks succeeded, "
+                f"{len(failed_chunks)} retried per resolution, "
+                f"{len(transcode_errors)} renditions failed"
+            )
+        
+            # Drop resolutions missing any chunk; fail only if none is complete
+            if transcode_errors:
+                complete_resolutions = [
+                    res for res, count in successful_by_resolution.items()
+                    if count == chunk_count
+                ]
             
-            if not complete_resolutions:
-                return {
-                    "success": False,
-                    "video_id": video_id,
-                    "stage": "transcode",
-                    "error": f"No resolution fully transcoded. Errors: {len(transcode_errors)}",
-                    "errors": transcode_errors,
-                    "thumbnail": thumbnail_result,
-                    "warnings": warnings if warnings else None,
-                }
+                if not complete_resolutions:
+                    return {
+                        "success": False,
+                        "video_id": video_id,
+                        "stage": "transcode",
+                        "error": f"No resolution fully transcoded. Errors: {len(transcode_errors)}",
+                        "errors": transcode_errors,
+                        "thumbnail": thumbnail_result,
+                        "warnings": warnings if warnings else None,
+                    }
             
-            # Continue with complete resolutions only
-            target_resolutions = complete_resolutions
-            workflow.logger.warning(
-                f"[{video_id}] Proceeding with complete resolutions: {complete_resolutions}"
-            )
+                # Continue with complete resolutions only
+                target_resolutions = complete_resolutions
+                workflow.logger.warning(
+                    f"[{video_id}] Proceeding with complete resolutions: {complete_resolutions}"
+                )
         
         # ==================== STAGE 7: GENERATE PLAYLISTS ====================
         playlist_tasks = []
@@ -550,7 +663,7 @@ class VideoWorkflow:
         for resolution in target_resolutions:
             task = workflow.execute_activity(
                 generate_hls_playlist,
-                args=[video_id, resolution, chunk_count],
+                args=[video_id, resolution, segment_durations],
                 start_to_close_timeout=timedelta(seconds=60),
                 task_queue="playlist-queue",
                 retry_policy=retry_policy,
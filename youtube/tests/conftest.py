@@ -0,0 +1,8 @@
+"""
+Pytest setup: make the youtube/ packages (shared, worker) importable, the
+same way the worker runners do.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
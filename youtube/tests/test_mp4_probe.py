@@ -0,0 +1,182 @@
+"""
+Tests for the pure-Python MP4 probe.
+
+Purpose: Keep mp4_probe in agreement with ffprobe, which it replaces on the
+         metadata and split paths.
+Logic:
+  - Fixture clips (fixtures/mp4/README.md) are checked against the ffprobe
+    output recorded in ffprobe.json, and against a live ffprobe when one is
+    on PATH
+  - The run-table walk in parse_keyframe_times is checked against a
+    per-sample expansion on randomized synthetic sample tables
+"""
+import asyncio
+import json
+import random
+import shutil
+import struct
+from pathlib import Path
+
+import pytest
+
+from worker.activities.mp4_probe import PROBE_READ_SIZE, mp4_keyframe_times, probe_mp4
+
+FIXTURES = Path(__file__).parent / "fixtures" / "mp4"
+FFPROBE = json.loads((FIXTURES / "ffprobe.json").read_text())
+
+# Layouts the probe parses itself; fragmented.mp4 must fall back to ffprobe
+PARSED_FIXTURES = ["faststart", "moov_at_end", "edit_list"]
+
+
+class RangeReader:
+    """read_range over in-memory bytes that records every request."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.calls = []
+
+    def __call__(self, offset: int, length: int) -> tuple:
+        self.calls.append((offset, length))
+        return self.data[offset:offset + length], len(self.data)
+
+
+def fixture_reader(name: str) -> RangeReader:
+    return RangeReader((FIXTURES / f"{name}.mp4").read_bytes())
+
+
+@pytest.mark.parametrize("name", PARSED_FIXTURES)
+def test_keyframe_times_match_ffprobe(name):
+    expected = FFPROBE[name]["keyframe_times"]
+
+    assert mp4_keyframe_times(fixture_reader(name)) == pytest.approx(expected, abs=1e-6)
+
+
+@pytest.mark.parametrize("name", PARSED_FIXTURES)
+def test_metadata_matches_ffprobe(name):
+    ffprobe = FFPROBE[name]
+    video = next(s for s in ffprobe["streams"] if s["codec_type"] == "video")
+    audio = next(s for s in ffprobe["streams"] if s["codec_type"] == "audio")
+    num, den = video["r_frame_rate"].split("/")
+
+    metadata = probe_mp4(fixture_reader(name))
+
+    assert metadata["duration"] == pytest.approx(float(ffprobe["format"]["duration"]), abs=1e-6)
+    assert metadata["width"] == video["width"]
+    assert metadata["height"] == video["height"]
+    assert metadata["fps"] == pytest.approx(float(num) / float(den))
+    assert metadata["video_codec"] == video["codec_name"]
+    assert metadata["audio_codec"] == audio["codec_name"]
+    assert metadata["format"] == ffprobe["format"]["format_name"]
+    assert metadata["bit_rate"] == int(ffprobe["format"]["bit_rate"])
+
+
+def test_fragmented_falls_back_to_ffprobe():
+    # ffprobe finds keyframes, but they live in moof boxes the probe does not read
+    assert FFPROBE["fragmented"]["keyframe_times"]
+
+    assert probe_mp4(fixture_reader("fragmented")) is None
+    assert mp4_keyframe_times(fixture_reader("fragmented")) is None
+
+
+def test_faststart_is_one_read():
+    reader = fixture_reader("faststart")
+
+    probe_mp4(reader)
+
+    assert reader.calls == [(0, PROBE_READ_SIZE)]
+
+
+def test_moov_at_end_skips_mdat():
+    reader = fixture_reader("moov_at_end")
+    assert len(reader.data) > PROBE_READ_SIZE
+
+    probe_mp4(reader)
+
+    # The first read, one header read past it, then moov itself; mdat is never fetched
+    assert len(reader.calls) == 3
+    assert sum(length for _, length in reader.calls[1:]) < len(reader.data) - PROBE_READ_SIZE
+
+
+@pytest.mark.skipif(shutil.which("ffprobe") is None, reason="ffprobe not installed")
+@pytest.mark.parametrize("name", PARSED_FIXTURES)
+def test_keyframe_times_match_live_ffprobe(name):
+    from worker.activities.chunked_transcode import probe_keyframe_times
+
+    expected = asyncio.run(probe_keyframe_times(str(FIXTURES / f"{name}.mp4")))
+
+    assert mp4_keyframe_times(fixture_reader(name)) == pytest.approx(expected, abs=1e-6)
+
+
+def box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type: bytes, version: int, payload: bytes) -> bytes:
+    return box(box_type, bytes([version, 0, 0, 0]) + payload)
+
+
+def build_mp4(stts: list, stss: list, ctts: list, edit_shift: int, timescale: int = 90000) -> bytes:
+    """Minimal ftyp + moov (one video trak) + mdat with the given sample tables."""
+    stbl = full_box(b"stts", 0, struct.pack(">I", len(stts)) + b"".join(struct.pack(">II", *r) for r in stts))
+    if stss is not None:
+        stbl += full_box(b"stss", 0, struct.pack(">I", len(stss)) + b"".join(struct.pack(">I", s) for s in stss))
+    if ctts:
+        stbl += full_box(b"ctts", 1, struct.pack(">I", len(ctts)) + b"".join(struct.pack(">Ii", *r) for r in ctts))
+
+    mdia = box(b"mdia", b"".join([
+        full_box(b"hdlr", 0, b"\0" * 4 + b"vide" + b"\0" * 12),
+        full_box(b"mdhd", 0, struct.pack(">IIII", 0, 0, timescale, 0) + b"\0" * 4),
+        box(b"minf", box(b"stbl", stbl)),
+    ]))
+    trak = mdia
+    if edit_shift is not None:
+        elst = full_box(b"elst", 0, struct.pack(">I", 1) + struct.pack(">Iihh", 1000, edit_shift, 1, 0))
+        trak = box(b"edts", elst) + trak
+
+    mvhd = full_box(b"mvhd", 0, b"\0" * 8 + struct.pack(">II", 1000, 1000) + b"\0" * 80)
+    moov = box(b"moov", mvhd + box(b"trak", trak))
+    return box(b"ftyp", b"isom\0\0\0\0") + moov + box(b"mdat", b"x" * 100)
+
+
+def expand_runs(runs: list) -> list:
+    return [value for count, value in runs for _ in range(count)]
+
+
+def test_keyframe_times_match_per_sample_expansion():
+    rng = random.Random(1234)
+
+    for _ in range(1000):
+        sample_count = rng.randint(1, 3000)
+
+        stts, left = [], sample_count
+        while left:
+            count = rng.randint(1, left)
+            stts.append((count, rng.choice([1500, 3000, 3003])))
+            left -= count
+
+        ctts, left = [], sample_count
+        if rng.random() < 0.7:
+            while left:
+                count = rng.randint(1, min(left, 5))
+                ctts.append((count, rng.choice([-3000, 0, 3000, 6000])))
+                left -= count
+
+        stss = None
+        if rng.random() < 0.9:
+            stss = sorted(rng.sample(range(1, sample_count + 1), rng.randint(1, min(sample_count, 50))))
+        edit_shift = rng.choice([None, 0, 6000])
+
+        # Reference: expand every sample's dts and composition offset
+        deltas = expand_runs(stts)
+        dts = [0]
+        for delta in deltas[:-1]:
+            dts.append(dts[-1] + delta)
+        offsets = expand_runs(ctts) or [0] * sample_count
+        sync_samples = stss if stss is not None else range(1, sample_count + 1)
+        expected = sorted(
+            (dts[s - 1] + offsets[s - 1] - (edit_shift or 0)) / 90000 for s in sync_samples
+        )
+
+        data = build_mp4(stts, stss, ctts, edit_shift)
+
+        assert mp4_keyframe_times(RangeReader(data)) == expected
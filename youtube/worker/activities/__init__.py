@@ -13,7 +13,8 @@ from worker.activities.thumbnail import generate_thumbnail, upload_custom_thumbn
 from worker.activities.scene_detection import detect_scenes, generate_chapter_files
 from worker.activities.chunked_transcode import (
     split_video,
-    transcode_chunk,
+    transcode_chunk_multi,
+    split_and_transcode,
     generate_hls_playlist,
     generate_master_playlist,
     cleanup_source_chunks,
@@ -30,7 +31,8 @@ __all__ = [
     'generate_chapter_files',
     # Chunk-based transcoding with HLS output
     'split_video',
-    'transcode_chunk',
+    'transcode_chunk_multi',
+    'split_and_transcode',
     'generate_hls_playlist',
     'generate_master_playlist',
     'cleanup_source_chunks',
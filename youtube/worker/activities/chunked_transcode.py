@@ -5,29 +5,606 @@ Purpose: Split videos into chunks, transcode in parallel, and generate HLS playl
 Consumers: Workers polling 'split-queue', 'transcode-queue', 'playlist-queue'.
 Logic:
   - split_video: Split source into GOP-aligned chunks + manifest
-  - transcode_chunk: Transcode a single chunk to HLS-compatible .ts segment
+  - transcode_chunk_multi: Decode one chunk once, encode every resolution
+  - split_and_transcode: One-pass 1:N transcode for small videos (no chunk bounce)
   - generate_hls_playlist: Create m3u8 playlists for adaptive streaming
+
+ffmpeg/ffprobe run via asyncio subprocesses and MinIO calls run in worker
+threads, so no activity blocks the event loop (heartbeats/cancellation work).
 """
 import os
-import json
+import math
+import csv
+import asyncio
+import logging
+import shutil
 import subprocess
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
+import orjson
 from temporalio import activity
-from shared.storage import MinIOStorage, StoragePaths
+from shared.storage import get_storage, StoragePaths
+from worker.activities.process import run_process, run_process_to_pipes
+from worker.activities.mp4_probe import mp4_keyframe_times
 
+logger = logging.getLogger(__name__)
 
-# Resolution configurations
+# Resolution configurations. x264_preset: low rungs have the most quality
+# headroom at a given CRF, so they trade a little compression for speed
 RESOLUTION_CONFIG = {
-    "320p": {"scale": "scale=-2:320", "height": 320},
-    "480p": {"scale": "scale=-2:480", "height": 480},
-    "720p": {"scale": "scale=-2:720", "height": 720},
-    "1080p": {"scale": "scale=-2:1080", "height": 1080},
+    "320p": {"height": 320, "x264_preset": "superfast"},
+    "480p": {"height": 480, "x264_preset": "superfast"},
+    "720p": {"height": 720, "x264_preset": "veryfast"},
+    "1080p": {"height": 1080, "x264_preset": "veryfast"},
 }
 
 # Default chunk duration in seconds (4s is common for HLS/DASH)
 DEFAULT_CHUNK_DURATION = 4
 
+# Split points are passed this many seconds before their keyframe
+SEGMENT_TIME_GUARD = 0.001
+
+# Max concurrent MinIO transfers per activity (network-bound, independent objects)
+TRANSFER_CONCURRENCY = 16
+
+# Hardware acceleration: HW_ACCEL=nvenc/auto (or 1/true) enables NVIDIA NVENC
+# encoding when a test encode succeeds on this host; otherwise libx264 is used.
+HW_ACCEL = os.getenv("HW_ACCEL", "").lower() in ("1", "true", "yes", "nvenc", "auto")
+
+# Probe: encode one tiny frame with h264_nvenc. Listing the encoder in
+# `ffmpeg -encoders` only proves it was compiled in, not that a GPU and
+# driver are present.
+NVENC_PROBE_COMMAND = [
+    "ffmpeg", "-hide_banner", "-loglevel", "error",
+    "-f", "lavfi", "-i", "color=black:size=256x256:duration=0.1",
+    "-frames:v", "1",
+    "-c:v", "h264_nvenc",
+    "-f", "null", "-",
+]
+
+# Encoder preset override (VIDEO_PRESET); when unset libx264 uses the
+# rendition's x264_preset and NVENC the default below. Batch VOD favours
+# speed over the last few percent of compression.
+VIDEO_PRESET = os.getenv("VIDEO_PRESET")
+X264_DEFAULT_PRESET = "veryfast"
+NVENC_DEFAULT_PRESET = "p4"
+X264_PRESET_BY_HEIGHT = {cfg["height"]: cfg["x264_preset"] for cfg in RESOLUTION_CONFIG.values()}
+
+# Constant-quality target (libx264 -crf / NVENC -cq), same scale for both
+VIDEO_CRF = os.getenv("VIDEO_CRF", "23")
+
+# libx264 psy tune for the content class (VIDEO_TUNE: film, animation,
+# grain, ...; empty for none), combined with fastdecode for playback devices
+VIDEO_TUNE = os.getenv("VIDEO_TUNE", "film")
+
+# libx264: short look-ahead and few reference frames keep encoder latency low;
+# frame threads (not slice threads) code more efficiently for VOD
+X264_TUNING_ARGS = [
+    "-tune", ",".join(filter(None, [VIDEO_TUNE, "fastdecode"])),
+    "-x264-params", "rc-lookahead=10:bframes=3:ref=3:aq-mode=1:sliced-threads=0",
+]
+
+# NVENC: constant-quality VBR with B-frames, short look-ahead and spatial AQ
+NVENC_TUNING_ARGS = [
+    "-gpu", "0",
+    "-tune", "hq",
+    "-rc", "vbr",
+    "-b:v", "0",
+    "-bf", "3",
+    "-rc-lookahead", "8",
+    "-spatial_aq", "1",
+    "-aq-strength", "8",
+]
+
+# Thread budget: TRANSCODE_CONCURRENCY ffmpeg processes share the worker's
+# cores, so each one gets cpu_count // concurrency encoder threads instead of
+# libx264's default of one thread per core (avoids oversubscription). The
+# transcode worker caps max_concurrent_activities at the same value.
+TRANSCODE_CONCURRENCY = int(os.getenv("TRANSCODE_CONCURRENCY", "4"))
+FFMPEG_THREADS = max(1, (os.cpu_count() or 1) // TRANSCODE_CONCURRENCY)
+
+# Scratch space: temp files go to a RAM-backed tmpfs (TRANSCODE_TMPDIR,
+# /dev/shm by default) when it has at least SHM_HEADROOM x the expected bytes
+# free, otherwise to the default temp dir
+SHM_DIR = os.getenv("TRANSCODE_TMPDIR", "/dev/shm")
+SHM_HEADROOM = 2
+
+# Global ffmpeg options (before inputs): no banner or periodic progress stats
+# on stderr (only warnings/errors get captured), cap filter graph threads
+FFMPEG_QUIET_ARGS = ["-hide_banner", "-nostats"]
+FFMPEG_GLOBAL_ARGS = [*FFMPEG_QUIET_ARGS, "-filter_threads", "2", "-filter_complex_threads", "2"]
+
+# Per-output audio encode, identical for every rendition and command builder
+AUDIO_ARGS = ["-c:a", "aac", "-b:a", "128k"]
+
+# Per-output MPEG-TS muxing for single HLS segments
+TS_MUX_ARGS = [
+    "-f", "mpegts",  # Output as MPEG-TS for HLS compatibility
+    "-muxdelay", "0",  # Minimize muxing delay
+    "-muxpreload", "0",  # No preload buffering
+    "-avoid_negative_ts", "make_zero",  # Ensure positive timestamps
+]
+
+# Max concurrent NVENC encode sessions per worker (consumer GPUs cap at 3-5)
+NVENC_MAX_SESSIONS = int(os.getenv("NVENC_MAX_SESSIONS", "3"))
+_nvenc_semaphore = asyncio.Semaphore(NVENC_MAX_SESSIONS)
+_nvenc_acquire_lock = asyncio.Lock()
+
+# Cached result of the NVENC probe (None = not probed yet)
+_nvenc_available = None
+_nvenc_probe_lock = threading.Lock()
+
+
+def scratch_dir(expected_bytes: int) -> str:
+    """
+    Pick a directory for an activity's temporary files.
+    
+    Purpose: Keep ephemeral split/transcode data in RAM (tmpfs) instead of
+             writing it to disk and reading it back for upload.
+    Consumers: tempfile.mkdtemp calls in this module.
+    Logic:
+      - SHM_DIR if it exists and has SHM_HEADROOM x expected_bytes free
+      - Otherwise None (tempfile's default, usually /tmp on disk)
+    
+    Args:
+        expected_bytes: Rough size of the data the activity will write
+        
+    Returns:
+        Directory path, or None for the default temp directory
+    """
+    try:
+        if shutil.disk_usage(SHM_DIR).free > SHM_HEADROOM * expected_bytes:
+            return SHM_DIR
+    except OSError:
+        pass
+    return None
+
+
+def check_nvenc_available() -> bool:
+    """
+    Check whether h264_nvenc can actually encode on this host.
+    
+    Purpose: Decide between GPU (NVENC) and CPU (libx264) encoding.
+    Consumers: transcode activities when HW_ACCEL is enabled; also called at
+               module import so the first chunk pays no probe latency.
+    Logic:
+      1. Return cached result if already probed in this process
+      2. Otherwise take the probe lock and re-check (only one probe per process)
+      3. Encode a single frame with h264_nvenc (needs the encoder compiled in
+         plus a working GPU/driver; fails fast otherwise)
+      4. Cache and return the result (False on any probe failure)
+    
+    Returns:
+        True if h264_nvenc is available, False otherwise
+    """
+    global _nvenc_available
+    
+    if _nvenc_available is not None:
+        return _nvenc_available
+    
+    with _nvenc_probe_lock:
+        if _nvenc_available is None:
+            try:
+                result = subprocess.run(
+                    NVENC_PROBE_COMMAND,
+                    capture_output=True,
+                    text=True,
+                    timeout=10
+                )
+                _nvenc_available = result.returncode == 0
+            except (OSError, subprocess.TimeoutExpired):
+                _nvenc_available = False
+            
+            # Module logger: this also runs at import, outside any activity context
+            logger.info(f"NVENC available: {_nvenc_available}")
+    
+    return _nvenc_available
+
+
+# Probe once at worker start-up when hardware acceleration is requested
+if HW_ACCEL:
+    check_nvenc_available()
+
+
+async def run_transfers(fn, items) -> list:
+    """
+    Run blocking MinIO transfers concurrently without blocking the event loop.
+    
+    Purpose: Share one bounded thread pool pattern across activities.
+    Consumers: split_video, split_and_transcode.
+    
+    Args:
+        fn: Blocking function taking one item (upload/download one object)
+        items: Iterable of items to transfer
+        
+    Returns:
+        List of fn results in input order
+    """
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=TRANSFER_CONCURRENCY) as executor:
+        return await asyncio.gather(*(loop.run_in_executor(executor, fn, item) for item in items))
+
+
+def use_nvenc_for(session_count: int) -> bool:
+    """
+    Decide whether an ffmpeg run opening session_count encoders uses NVENC.
+    
+    Runs needing more sessions than NVENC_MAX_SESSIONS encode with libx264:
+    nvenc_sessions cannot reserve them, and opening them anyway would exceed
+    the GPU's session limit.
+    """
+    return HW_ACCEL and session_count <= NVENC_MAX_SESSIONS and check_nvenc_available()
+
+
+@asynccontextmanager
+async def nvenc_sessions(count: int):
+    """
+    Reserve NVENC encoder sessions for the duration of an ffmpeg run.
+    
+    Purpose: Prevent "out of NVENC sessions" failures when several activities
+             encode on the same GPU at once.
+    Consumers: transcode_chunk_multi, split_and_transcode.
+    Logic:
+      1. Reject requests above NVENC_MAX_SESSIONS (use_nvenc_for routes those
+         to libx264); 0 = CPU encode, no-op
+      2. Acquire permits one by one under a lock, so two multi-session
+         requests can never each hold half of the pool and deadlock
+      3. Release every permit taken when the block exits, including the ones
+         already held if the task is cancelled while waiting for the rest
+    
+    Args:
+        count: Number of NVENC encoders the ffmpeg process will open
+        
+    Raises:
+        ValueError: If count exceeds NVENC_MAX_SESSIONS
+    """
+    if count > NVENC_MAX_SESSIONS:
+        raise ValueError(f"{count} NVENC sessions requested, limit is {NVENC_MAX_SESSIONS}")
+    
+    acquired = 0
+    try:
+        async with _nvenc_acquire_lock:
+            for _ in range(count):
+                await _nvenc_semaphore.acquire()
+                acquired += 1
+        yield
+    finally:
+        for _ in range(acquired):
+            _nvenc_semaphore.release()
+
+
+def build_input_args(input_path: str, use_nvenc: bool = False, has_watermark: bool = False) -> list:
+    """
+    Build ffmpeg input options for one source chunk.
+    
+    Purpose: Select GPU or CPU decoding for a chunk input.
+    Consumers: build_multi_transcode_command, build_fused_transcode_command.
+    Logic:
+      - NVENC without watermark: decode on GPU and keep frames in VRAM
+      - NVENC with watermark: decode on GPU, frames downloaded for drawtext
+      - Otherwise: plain software decode
+    
+    Args:
+        input_path: Local path or presigned URL of the source chunk
+        use_nvenc: Whether the chunk will be encoded with h264_nvenc
+        has_watermark: Whether a software watermark filter will be applied
+        
+    Returns:
+        List of ffmpeg input arguments (ending with -i <input_path>)
+    """
+    if use_nvenc and not has_watermark:
+        return ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda", "-i", input_path]
+    if use_nvenc:
+        return ["-hwaccel", "cuda", "-i", input_path]
+    return ["-i", input_path]
+
+
+def build_encoder_args(
+    use_nvenc: bool = False,
+    threads: int = FFMPEG_THREADS,
+    height: int = None
+) -> list:
+    """
+    Build ffmpeg video encoder options.
+    
+    Purpose: Single source of truth for encoder settings.
+    Consumers: build_multi_transcode_command, build_fused_transcode_command.
+    Logic:
+      - Preset comes from VIDEO_PRESET, defaulting to a throughput-oriented
+        preset (the rendition's x264_preset for libx264, p4 for NVENC)
+      - Quality target comes from VIDEO_CRF
+      - Append the encoder's rate-control / look-ahead tuning
+      - Cap encoder threads to this process's share of the CPU
+    
+    Args:
+        use_nvenc: Encode with h264_nvenc instead of libx264
+        threads: Encoder thread count for this output
+        height: Output height, selects the per-rendition libx264 preset
+        
+    Returns:
+        List of ffmpeg video encoder arguments
+    """
+    if use_nvenc:
+        return [
+            "-c:v", "h264_nvenc",
+            "-preset", VIDEO_PRESET or NVENC_DEFAULT_PRESET,
+            "-cq", VIDEO_CRF,
+            *NVENC_TUNING_ARGS,
+            "-threads", str(threads),
+        ]
+    return [
+        "-c:v", "libx264",
+        "-preset", VIDEO_PRESET or X264_PRESET_BY_HEIGHT.get(height, X264_DEFAULT_PRESET),
+        "-crf", VIDEO_CRF,
+        *X264_TUNING_ARGS,
+        "-threads", str(threads),
+    ]
+
+
+def build_split_scale_graph(heights: list[int], watermark_filter: str = None, use_nvenc: bool = False) -> str:
+    """
+    Build a filter_complex graph that turns decoded video into one scaled
+    branch per rendition, labelled [o0], [o1], ...
+    
+    Purpose: Decode once, scale N times (1:N transcoding).
+    Consumers: build_fused_transcode_command, build_multi_transcode_command.
+    Logic:
+      - Renditions are scaled as a cascade from the largest down: the top
+        rendition scales the source, every other one scales the previous
+        (already smaller) rendition, so each scaler reads ~2x fewer pixels
+        than a scale from the full-size source
+      - NVENC without watermark: frames stay on the GPU and scale with scale_npp
+      - Otherwise: software scale; the optional drawtext watermark is applied
+        per output, after the cascade tap, so it is never scaled twice
+    
+    Args:
+        heights: Target height per rendition
+        watermark_filter: Optional drawtext filter applied after scaling
+        use_nvenc: Whether the graph feeds NVENC encoders
+        
+    Returns:
+        filter_complex graph string
+    """
+    gpu_scale = use_nvenc and not watermark_filter
+    order = sorted(range(len(heights)), key=lambda i: heights[i], reverse=True)
+    
+    graph = []
+    source = "[0:v]"
+    for i in order:
+        scale = f"scale_npp=-2:{heights[i]}" if gpu_scale else f"scale=-2:{heights[i]}"
+        if i == order[-1]:
+            # Smallest rendition: nothing scales from it
+            watermark = f",{watermark_filter}" if watermark_filter else ""
+            graph.append(f"{source}{scale}{watermark}[o{i}]")
+        elif watermark_filter:
+            graph.append(f"{source}{scale},split=2[s{i}][c{i}]")
+            graph.append(f"[s{i}]{watermark_filter}[o{i}]")
+        else:
+            graph.append(f"{source}{scale},split=2[o{i}][c{i}]")
+        source = f"[c{i}]"
+    
+    return ";".join(graph)
+
+
+def build_multi_transcode_command(
+    input_path: str,
+    output_paths: list[str],
+    heights: list[int],
+    watermark_filter: str = None,
+    use_nvenc: bool = False,
+    copy_output_paths: list[str] = None
+) -> list:
+    """
+    Build one ffmpeg command that decodes a chunk once and encodes it to every
+    rendition as a single HLS .ts segment each.
+    
+    Purpose: 1:N transcoding of one chunk (one decode instead of one per rendition).
+    Consumers: transcode_chunk_multi.
+    Logic:
+      - Encoded renditions: decode -> split -> scale -> encode
+      - Passthrough renditions: video stream-copied into MPEG-TS (no decode,
+        no encode); audio is still normalized to AAC like every other rendition
+    
+    Args:
+        input_path: Local path or presigned URL of the source chunk
+        output_paths: Output .ts path (or pipe:N target) per encoded rendition
+        heights: Target height per encoded rendition (same order as output_paths)
+        watermark_filter: Optional drawtext filter applied after scaling
+        use_nvenc: Encode with h264_nvenc instead of libx264
+        copy_output_paths: Output .ts paths (or pipe:N targets) for stream-copied renditions
+        
+    Returns:
+        ffmpeg command as list
+    """
+    copy_output_paths = copy_output_paths or []
+    
+    cmd = [
+        "ffmpeg",
+        *FFMPEG_GLOBAL_ARGS,
+        *build_input_args(input_path, use_nvenc and bool(heights), bool(watermark_filter)),
+    ]
+    if heights:
+        cmd.extend(["-filter_complex", build_split_scale_graph(heights, watermark_filter, use_nvenc)])
+    
+    # The process's thread budget is split across its encoders
+    threads = max(1, FFMPEG_THREADS // max(1, len(output_paths)))
+    
+    for i, (output_path, height) in enumerate(zip(output_paths, heights)):
+        cmd.extend([
+            "-map", f"[o{i}]",
+            "-map", "0:a:0?",
+            *build_encoder_args(use_nvenc, threads, height),
+            *AUDIO_ARGS,
+            *TS_MUX_ARGS,
+            "-y",
+            output_path,
+        ])
+    
+    for output_path in copy_output_paths:
+        cmd.extend([
+            "-map", "0:v:0",
+            "-map", "0:a:0?",
+            "-c:v", "copy",
+            *AUDIO_ARGS,
+            *TS_MUX_ARGS,
+            "-y",
+            output_path,
+        ])
+    
+    return cmd
+
+
+def build_fused_transcode_command(
+    input_path: str,
+    output_patterns: list[str],
+    heights: list[int],
+    watermark_filter: str = None,
+    chunk_duration: int = DEFAULT_CHUNK_DURATION,
+    use_nvenc: bool = False,
+    segment_list_path: str = None
+) -> list:
+    """
+    Build one ffmpeg command that decodes once and emits every rendition as
+    HLS .ts segments.
+    
+    Purpose: 1:N transcoding for small videos (no split/upload/download bounce).
+    Consumers: split_and_transcode.
+    Logic:
+      1. Decode the source once (on GPU with NVENC and no watermark)
+      2. split the decoded video into one branch per rendition and scale each
+         (scale_npp on GPU, scale + optional drawtext in software)
+      3. Encode each branch and cut it into chunk_duration segments with the
+         segment muxer; keyframes are forced on segment boundaries so every
+         rendition produces the same number of segments
+    
+    Args:
+        input_path: Local path or presigned URL of the source video
+        output_patterns: Segment filename pattern per rendition (e.g. .../seg_%04d.ts)
+        heights: Target height per rendition (same order as output_patterns)
+        watermark_filter: Optional drawtext filter applied after scaling
+        chunk_duration: Segment duration in seconds
+        use_nvenc: Encode with h264_nvenc instead of libx264
+        segment_list_path: Optional CSV (filename,start,end per segment) written
+            for the first rendition; all renditions share its cut points
+        
+    Returns:
+        ffmpeg command as list
+    """
+    cmd = [
+        "ffmpeg",
+        *FFMPEG_GLOBAL_ARGS,
+        *build_input_args(input_path, use_nvenc, bool(watermark_filter)),
+        "-filter_complex", build_split_scale_graph(heights, watermark_filter, use_nvenc),
+    ]
+    
+    # The process's thread budget is split across its encoders
+    threads = max(1, FFMPEG_THREADS // len(output_patterns))
+    
+    for i, (output_pattern, height) in enumerate(zip(output_patterns, heights)):
+        cmd.extend([
+            "-map", f"[o{i}]",
+            "-map", "0:a:0?",
+            *build_encoder_args(use_nvenc, threads, height),
+            "-force_key_frames", f"expr:gte(t,n_forced*{chunk_duration})",
+            *AUDIO_ARGS,
+            "-f", "segment",
+            "-segment_time", str(chunk_duration),
+            "-segment_format", "mpegts",
+            *(["-segment_list", segment_list_path, "-segment_list_type", "csv"]
+              if segment_list_path and i == 0 else []),
+            "-y",
+            output_pattern,
+        ])
+    
+    return cmd
+
+
+async def probe_keyframe_times(input_path: str) -> list:
+    """
+    List keyframe timestamps of the first video stream.
+    
+    Purpose: Let split_video cut exactly on existing keyframes (scene cuts
+             included) instead of fixed intervals.
+    Consumers: split_video.
+    Logic:
+      1. ffprobe packet pts_time + flags (no decoding, fast)
+      2. Keep packets flagged K (keyframes)
+    
+    Args:
+        input_path: Path or URL of the source video
+        
+    Returns:
+        Sorted list of keyframe times in seconds (empty if the probe fails)
+    """
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        input_path
+    ]
+    
+    try:
+        result = await run_process(cmd, timeout=120)
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    
+    if result.returncode != 0:
+        return []
+    
+    keyframes = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            keyframes.append(float(pts_time))
+    
+    return sorted(keyframes)
+
+
+def select_segment_times(keyframes: list, chunk_duration: float) -> list:
+    """
+    Pick split points from keyframe times, close to chunk_duration apart.
+    
+    Purpose: Each chunk starts on a keyframe the source encoder already placed
+             (typically a scene change), so no chunk begins mid-GOP.
+    Consumers: split_video.
+    Logic:
+      - For each boundary, take the keyframe nearest to last_cut + chunk_duration
+      - Never cut less than chunk_duration / 2 after the previous cut
+    
+    Args:
+        keyframes: Sorted keyframe times in seconds
+        chunk_duration: Target chunk duration in seconds
+        
+    Returns:
+        List of cut times in seconds (excluding 0)
+    """
+    min_length = chunk_duration / 2
+    cuts = []
+    last_cut = 0.0
+    i = 0
+    n = len(keyframes)
+    
+    while True:
+        while i < n and keyframes[i] < last_cut + min_length:
+            i += 1
+        if i >= n:
+            break
+        
+        target = last_cut + chunk_duration
+        while i + 1 < n and abs(keyframes[i + 1] - target) <= abs(keyframes[i] - target):
+            i += 1
+        
+        last_cut = keyframes[i]
+        cuts.append(last_cut)
+        i += 1
+    
+    return cuts
+
 
 @activity.defn
 async def split_video(video_id: str, chunk_duration: int = DEFAULT_CHUNK_DURATION) -> dict:
@@ -37,9 +614,13 @@ async def split_video(video_id: str, chunk_duration: int = DEFAULT_CHUNK_DURATIO
     Purpose: Prepare video for parallel transcoding by splitting at keyframes.
     Consumers: Workflow orchestrator after metadata extraction.
     Logic:
-      1. Download source video from MinIO
-      2. Use ffmpeg to split at keyframes (GOP boundaries)
-      3. Upload chunks to MinIO: videos/{video_id}/chunks/source/
+      1. Presign the source video; ffmpeg streams it (no local source copy)
+      2. Read keyframe times from the MP4 sample tables (ranged reads of moov,
+         ffprobe packet scan for other containers), pick cut points
+         ~chunk_duration apart, then split with -segment_times (falls back to
+         -segment_time if no keyframes are known); the muxer's CSV segment
+         list gives exact start/end times per chunk
+      3. Upload chunks to MinIO in parallel: videos/{video_id}/chunks/source/
       4. Create and upload manifest with chunk metadata
       5. Cleanup temp files
     
@@ -56,74 +637,100 @@ async def split_video(video_id: str, chunk_duration: int = DEFAULT_CHUNK_DURATIO
     """
     activity.logger.info(f"[{video_id}] Starting video split (chunk_duration={chunk_duration}s)")
     
-    storage = MinIOStorage()
+    storage = get_storage()
     temp_dir = None
-    temp_input_path = None
+    source_key = StoragePaths.source_video(video_id)
     
     try:
-        # Create temp directory for chunks
-        temp_dir = tempfile.mkdtemp(prefix=f"split_{video_id}_")
-        
-        # Step 1: Download source video
-        activity.logger.info(f"[{video_id}] Downloading source video")
-        temp_input_path = os.path.join(temp_dir, "source.mp4")
+        # Create temp directory for chunks (chunks ~ source size)
+        input_size = await asyncio.to_thread(storage.get_object_size, "videos", source_key) or 0
+        temp_dir = tempfile.mkdtemp(prefix=f"split_{video_id}_", dir=scratch_dir(input_size))
+        activity.logger.info(f"[{video_id}] Source size: {input_size / (1024*1024):.2f} MB")
         
-        success = storage.download_file(
+        # Step 1: Presigned URL for the source video. ffmpeg reads it over HTTP
+        # (range requests handle moov-at-end files), so the source is never
+        # written to local disk and read back
+        source_url = storage.get_object_url(
             bucket_name="videos",
-            object_name=StoragePaths.source_video(video_id),
-            file_path=temp_input_path
+            object_name=source_key,
+            expiration=1800
         )
         
-        if not success:
-            raise RuntimeError(f"Failed to download video {video_id} from MinIO")
-        
-        input_size = os.path.getsize(temp_input_path)
-        activity.logger.info(f"[{video_id}] Source size: {input_size / (1024*1024):.2f} MB")
+        if not source_url:
+            raise RuntimeError(f"Failed to presign video {video_id}")
         
         # Step 2: Split video using ffmpeg segment muxer
         # -f segment: Use segment muxer
-        # -segment_time: Target segment duration
+        # -segment_times: Cut exactly at the chosen source keyframes
         # -reset_timestamps 1: Reset timestamps for each segment
+        # -avoid_negative_ts make_zero: No negative leading DTS in any chunk
+        # -segment_list (csv): Exact filename,start,end per chunk for the manifest
         # -c copy: Copy streams without re-encoding (fast)
-        # -force_key_frames: Force keyframes at segment boundaries
         chunk_pattern = os.path.join(temp_dir, "chunk_%04d.mp4")
+        segment_list_path = os.path.join(temp_dir, "chunks.csv")
+        
+        # MP4 keyframes come from the moov sample tables (a few small range
+        # requests); only other containers need ffprobe to scan packets, which
+        # would otherwise read the whole source a second time
+        def read_range(offset: int, length: int) -> tuple:
+            return storage.get_object_range("videos", source_key, offset, length)
+        
+        keyframes = await asyncio.to_thread(mp4_keyframe_times, read_range)
+        if keyframes is None:
+            keyframes = await probe_keyframe_times(source_url)
+        
+        segment_times = select_segment_times(keyframes, chunk_duration)
+        if segment_times:
+            # Cut times sit a hair before each keyframe so rounding to 6 decimals
+            # can never push a cut past its keyframe (the muxer cuts at the first
+            # keyframe at or after each time)
+            segment_args = [
+                "-segment_times",
+                ",".join(f"{max(0.0, t - SEGMENT_TIME_GUARD):.6f}" for t in segment_times)
+            ]
+        else:
+            # No keyframe info (or a single GOP): let the muxer cut on its own
+            segment_args = ["-segment_time", str(chunk_duration)]
         
         cmd = [
             "ffmpeg",
-            "-i", temp_input_path,
+            *FFMPEG_QUIET_ARGS,
+            "-i", source_url,
             "-c", "copy",
+            "-map", "0",
             "-f", "segment",
-            "-segment_time", str(chunk_duration),
+            *segment_args,
             "-reset_timestamps", "1",
-            "-map", "0",
+            "-avoid_negative_ts", "make_zero",
+            "-segment_list", segment_list_path,
+            "-segment_list_type", "csv",
             "-y",
             chunk_pattern
         ]
         
         activity.logger.info(f"[{video_id}] Running ffmpeg split")
         
-        process = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=300
-        )
+        process = await run_process(cmd, timeout=300)
         
         if process.returncode != 0:
             activity.logger.error(f"[{video_id}] ffmpeg split failed: {process.stderr[-500:]}")
             raise RuntimeError(f"ffmpeg split failed: {process.stderr[-200:]}")
         
-        # Step 3: Collect and upload chunks
-        chunk_files = sorted(Path(temp_dir).glob("chunk_*.mp4"))
-        chunks = []
+        # Step 3: Collect chunks from the segment list (in output order) and
+        # upload them in parallel (uploads are independent)
+        with open(segment_list_path, newline="") as f:
+            segment_rows = [row for row in csv.reader(f) if row]
         
-        activity.logger.info(f"[{video_id}] Uploading {len(chunk_files)} chunks")
+        activity.logger.info(
+            f"[{video_id}] Uploading {len(segment_rows)} chunks "
+            f"({TRANSFER_CONCURRENCY} concurrent)"
+        )
         
-        for idx, chunk_file in enumerate(chunk_files):
-            chunk_size = chunk_file.stat().st_size
+        def upload_one(item: tuple[int, list]) -> dict:
+            idx, (filename, start_time, end_time) = item
+            chunk_file = Path(temp_dir) / filename
             chunk_key = StoragePaths.source_chunk(video_id, idx)
             
-            # Upload chunk to MinIO
             upload_success = storage.upload_file(
                 file_path=str(chunk_file),
                 bucket_name="videos",
@@ -133,13 +740,17 @@ async def split_video(video_id: str, chunk_duration: int = DEFAULT_CHUNK_DURATIO
             if not upload_success:
                 raise RuntimeError(f"Failed to upload chunk {idx}")
             
-            chunks.append({
+            return {
                 "index": idx,
                 "key": chunk_key,
-                "size_bytes": chunk_size
-            })
-            
-            activity.logger.debug(f"[{video_id}] Uploaded chunk {idx}: {chunk_size / 1024:.1f} KB")
+                "size_bytes": chunk_file.stat().st_size,
+                "start_time": float(start_time),
+                "end_time": float(end_time),
+                "duration": float(end_time) - float(start_time)
+            }
+        
+        # Results keep input order, so chunks stay sorted by index
+        chunks = await run_transfers(upload_one, enumerate(segment_rows))
         
         # Step 4: Create and upload manifest
         manifest = {
@@ -151,9 +762,10 @@ async def split_video(video_id: str, chunk_duration: int = DEFAULT_CHUNK_DURATIO
         }
         
         manifest_key = StoragePaths.source_manifest(video_id)
-        manifest_bytes = json.dumps(manifest, indent=2).encode('utf-8')
+        manifest_bytes = orjson.dumps(manifest, option=orjson.OPT_INDENT_2)
         
-        storage.upload_fileobj(
+        await asyncio.to_thread(
+            storage.upload_fileobj,
             file_data=manifest_bytes,
             bucket_name="videos",
             object_name=manifest_key
@@ -179,9 +791,8 @@ async def split_video(video_id: str, chunk_duration: int = DEFAULT_CHUNK_DURATIO
         activity.logger.error(f"[{video_id}] Split failed: {e}")
         raise
     finally:
-        # Cleanup temp directory
-        if temp_dir and Path(temp_dir).exists():
-            import shutil
+        # Cleanup temp directory (ignore_errors covers a directory that was never populated)
+        if temp_dir:
             shutil.rmtree(temp_dir, ignore_errors=True)
 
 
@@ -273,80 +884,79 @@ def build_watermark_filter(
 
 
 @activity.defn
-async def transcode_chunk(
+async def transcode_chunk_multi(
     video_id: str,
     chunk_index: int,
-    resolution: str,
     source_chunk_key: str,
+    resolutions: list[str],
     watermark_text: str = None,
     watermark_position: str = "bottom-right",
     watermark_font_size: int = 24,
-    watermark_opacity: float = 0.5
+    watermark_opacity: float = 0.5,
+    passthrough_resolutions: list[str] = None
 ) -> dict:
     """
-    Transcode a single chunk to target resolution with optional watermark.
+    Transcode one chunk to every target resolution in a single ffmpeg process.
     
-    Purpose: Process one chunk independently for parallel execution.
-    Consumers: Workflow orchestrator spawning parallel tasks.
+    Purpose: Decode each chunk once (NVDEC with NVENC) and fan out to all
+             renditions via split + scale_npp, instead of one decode per
+             (chunk, resolution) pair.
+    Consumers: Workflow orchestrator fanning out one task per chunk.
     Logic:
-      1. Download source chunk from MinIO
-      2. Build video filter (scale + optional watermark)
-      3. Transcode to target resolution using ffmpeg
-      4. Upload encoded chunk to MinIO: videos/{video_id}/outputs/{resolution}/segments/
-      5. Cleanup temp files
+      1. Presign the source chunk (ffmpeg reads it directly)
+      2. Run one ffmpeg: decode -> split -> scale per rendition -> encode;
+         passthrough renditions (source already H.264 at that height) are
+         stream-copied instead of encoded
+      3. Each rendition is written to its own pipe and uploaded from memory to
+         videos/{video_id}/outputs/{resolution}/segments/ (no scratch files)
     
     Args:
         video_id: Unique identifier for the video
-        chunk_index: Index of the chunk (for ordering)
-        resolution: Target resolution (e.g., "720p")
-        source_chunk_key: MinIO key for the source chunk
+        chunk_index: Index of the chunk
+        source_chunk_key: MinIO key for source chunk
+        resolutions: Target resolutions (e.g., ["480p", "720p"])
         watermark_text: Optional text to overlay on video
         watermark_position: Position of watermark (top-left, top-right, bottom-left, bottom-right)
         watermark_font_size: Font size for watermark text
         watermark_opacity: Opacity of watermark background (0-1)
+        passthrough_resolutions: Subset of resolutions matching the H.264
+            source height; stream-copied (ignored when a watermark is set)
         
     Returns:
         Dictionary with:
         - video_id: str
         - chunk_index: int
-        - resolution: str
-        - output_key: str (path to encoded chunk in MinIO)
-        - has_watermark: bool
+        - results: list of per-resolution dicts (output_key, sizes, encoder;
+          encoder is "copy" for passthrough renditions)
+        - encoder: str (h264_nvenc or libx264)
         - success: bool
     """
     activity.logger.info(
-        f"[{video_id}] Transcoding chunk {chunk_index} to {resolution}"
+        f"[{video_id}] Transcoding chunk {chunk_index} to {resolutions}"
         + (f" with watermark" if watermark_text else "")
     )
     
-    if resolution not in RESOLUTION_CONFIG:
-        raise ValueError(f"Unknown resolution: {resolution}")
+    unknown = [r for r in resolutions if r not in RESOLUTION_CONFIG]
+    if unknown:
+        raise ValueError(f"Unknown resolution(s): {unknown}")
     
-    config = RESOLUTION_CONFIG[resolution]
-    storage = MinIOStorage()
-    temp_input_path = None
-    temp_output_path = None
+    storage = get_storage()
     
     try:
-        # Step 1: Download source chunk
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tmp_in:
-            temp_input_path = tmp_in.name
+        input_size = await asyncio.to_thread(storage.get_object_size, "videos", source_chunk_key) or 0
         
-        success = storage.download_file(
+        # Step 1: Presigned URL for the source chunk (read directly by ffmpeg)
+        source_url = storage.get_object_url(
             bucket_name="videos",
             object_name=source_chunk_key,
-            file_path=temp_input_path
+            expiration=1800
         )
         
-        if not success:
-            raise RuntimeError(f"Failed to download chunk {source_chunk_key}")
-        
-        # Step 2: Build video filter chain
-        # Start with scale filter
-        filters = [config["scale"]]
+        if not source_url:
+            raise RuntimeError(f"Failed to presign chunk {source_chunk_key}")
         
-        # Add watermark if provided
-        has_watermark = False
+        # Step 2: Decode once, encode every rendition
+        watermark_filter = None
         if watermark_text and watermark_text.strip():
             watermark_filter = build_watermark_filter(
                 text=watermark_text.strip(),
@@ -354,93 +964,285 @@ async def transcode_chunk(
                 font_size=watermark_font_size,
                 opacity=watermark_opacity
             )
-            filters.append(watermark_filter)
-            has_watermark = True
-            activity.logger.debug(f"[{video_id}] Watermark filter: {watermark_filter}")
         
-        # Combine filters with comma separator
-        video_filter = ",".join(filters)
-        
-        # Step 3: Transcode chunk to HLS-compatible MPEG-TS format
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f"_{resolution}.ts") as tmp_out:
-            temp_output_path = tmp_out.name
-        
-        cmd = [
-            "ffmpeg",
-            "-i", temp_input_path,
-            "-vf", video_filter,
-            "-c:v", "libx264",
-            "-preset", "medium",
-            "-crf", "23",
-            "-c:a", "aac",
-            "-b:a", "128k",
-            "-f", "mpegts",  # Output as MPEG-TS for HLS compatibility
-            "-muxdelay", "0",  # Minimize muxing delay
-            "-muxpreload", "0",  # No preload buffering
-            "-avoid_negative_ts", "make_zero",  # Ensure positive timestamps
-            "-fflags", "+genpts+igndts",  # Generate PTS, ignore input DTS discontinuities
-            "-y",
-            temp_output_path
+        # A watermark has to be burned in, so passthrough only applies without one
+        copy_resolutions = [
+            r for r in (passthrough_resolutions or [])
+            if r in resolutions and watermark_filter is None
         ]
+        encode_resolutions = [r for r in resolutions if r not in copy_resolutions]
+        
+        # One NVENC session per encoded rendition; too many falls back to libx264
+        use_nvenc = use_nvenc_for(len(encode_resolutions))
+        encoder = "h264_nvenc" if use_nvenc else "libx264"
+        
+        output_order = encode_resolutions + copy_resolutions
+        
+        def build_cmd(outputs: list[str]) -> list:
+            return build_multi_transcode_command(
+                input_path=source_url,
+                output_paths=outputs[:len(encode_resolutions)],
+                heights=[RESOLUTION_CONFIG[r]["height"] for r in encode_resolutions],
+                watermark_filter=watermark_filter,
+                use_nvenc=use_nvenc,
+                copy_output_paths=outputs[len(encode_resolutions):]
+            )
         
-        process = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=120  # 2 min per chunk should be plenty
+        # Step 3: Upload every rendition as ffmpeg writes it
+        def upload_from(resolution: str):
+            def upload(pipe) -> dict:
+                output_key = StoragePaths.output_segment(video_id, resolution, chunk_index)
+                
+                # One segment is a few MB: buffer it so the upload never stalls
+                # ffmpeg, and its size comes for free
+                data = pipe.read()
+                if not data:
+                    # ffmpeg failed before writing; its exit status is reported below
+                    return None
+                
+                if not storage.upload_fileobj(data, "videos", output_key):
+                    raise RuntimeError(f"Failed to upload {resolution} chunk {chunk_index}")
+                
+                return {
+                    "video_id": video_id,
+                    "chunk_index": chunk_index,
+                    "resolution": resolution,
+                    "output_key": output_key,
+                    "input_size_bytes": input_size,
+                    "output_size_bytes": len(data),
+                    "has_watermark": watermark_filter is not None,
+                    "encoder": "copy" if resolution in copy_resolutions else encoder,
+                    "success": True
+                }
+            return upload
+        
+        activity.logger.debug(
+            f"[{video_id}] Encoding chunk {chunk_index} x{len(encode_resolutions)} with {encoder}"
+            + (f", copying {copy_resolutions}" if copy_resolutions else "")
         )
         
+        # Hold one NVENC session per encoder this process opens
+        async with nvenc_sessions(len(encode_resolutions) if use_nvenc else 0):
+            # 2 min budget per rendition
+            process, results = await run_process_to_pipes(
+                build_cmd, [upload_from(r) for r in output_order], timeout=120 * len(resolutions)
+            )
+        
         if process.returncode != 0:
             activity.logger.error(
                 f"[{video_id}] ffmpeg failed for chunk {chunk_index}: {process.stderr[-300:]}"
             )
             raise RuntimeError(f"ffmpeg failed for chunk {chunk_index}")
         
+        missing = [r for r, result in zip(output_order, results) if result is None]
+        if missing:
+            raise RuntimeError(f"ffmpeg produced no {missing} output for chunk {chunk_index}")
         
-        # Step 4: Upload encoded chunk
-        output_key = StoragePaths.output_segment(video_id, resolution, chunk_index)
+        activity.logger.info(
+            f"[{video_id}] Chunk {chunk_index} -> {resolutions} complete ({encoder})"
+            + (f" (watermarked)" if watermark_filter else "")
+        )
+        
+        return {
+            "video_id": video_id,
+            "chunk_index": chunk_index,
+            "results": results,
+            "encoder": encoder,
+            "success": True
+        }
+        
+    except subprocess.TimeoutExpired:
+        activity.logger.error(f"[{video_id}] ffmpeg timeout for chunk {chunk_index}")
+        raise RuntimeError(f"ffmpeg timed out for chunk {chunk_index}")
+    except Exception as e:
+        activity.logger.error(f"[{video_id}] Transcode chunk {chunk_index} failed: {e}")
+        raise
+
+
+@activity.defn
+async def split_and_transcode(
+    video_id: str,
+    resolutions: list[str],
+    chunk_duration: int = DEFAULT_CHUNK_DURATION,
+    watermark_text: str = None,
+    watermark_position: str = "bottom-right",
+    watermark_font_size: int = 24,
+    watermark_opacity: float = 0.5
+) -> dict:
+    """
+    Transcode a small video to all resolutions as HLS segments in one ffmpeg pass.
+    
+    Purpose: Skip the split → MinIO → download bounce for videos small enough
+             to transcode on a single worker.
+    Consumers: Workflow orchestrator for small sources (FUSED_TRANSCODE_MAX_BYTES).
+    Logic:
+      1. Presign the source video (ffmpeg streams it, no download step)
+      2. Decode once, scale to every resolution, encode and segment (1:N)
+      3. Verify every resolution produced the same number of segments
+      4. Upload segments to videos/{video_id}/outputs/{resolution}/segments/
+      5. Cleanup temp files
+    
+    Args:
+        video_id: Unique identifier for the video
+        resolutions: Target resolutions (e.g., ["720p", "480p"])
+        chunk_duration: Segment duration in seconds (default: 4)
+        watermark_text: Optional text to overlay on video
+        watermark_position: Position of watermark (top-left, top-right, bottom-left, bottom-right)
+        watermark_font_size: Font size for watermark text
+        watermark_opacity: Opacity of watermark background (0-1)
         
-        upload_success = storage.upload_file(
-            file_path=temp_output_path,
+    Returns:
+        Dictionary with:
+        - video_id: str
+        - chunk_count: int (segments per resolution)
+        - segment_durations: list[float] (seconds per segment, for the playlists)
+        - resolutions: list[str]
+        - encoder: str (h264_nvenc or libx264)
+        - success: bool
+    """
+    activity.logger.info(
+        f"[{video_id}] Starting fused split+transcode to {resolutions} "
+        f"(chunk_duration={chunk_duration}s)"
+        + (f" with watermark" if watermark_text else "")
+    )
+    
+    unknown = [r for r in resolutions if r not in RESOLUTION_CONFIG]
+    if unknown:
+        raise ValueError(f"Unknown resolutions: {unknown}")
+    
+    storage = get_storage()
+    temp_dir = None
+    
+    try:
+        # Only the segments of every rendition land on local disk
+        source_size = await asyncio.to_thread(
+            storage.get_object_size, "videos", StoragePaths.source_video(video_id)
+        ) or 0
+        temp_dir = tempfile.mkdtemp(prefix=f"fused_{video_id}_", dir=scratch_dir(source_size))
+        
+        # Step 1: Presigned URL for the source video. ffmpeg reads it over HTTP
+        # while decoding, so fetching overlaps with encoding instead of a full
+        # download having to finish first
+        source_url = storage.get_object_url(
             bucket_name="videos",
-            object_name=output_key
+            object_name=StoragePaths.source_video(video_id),
+            expiration=1800
         )
         
-        if not upload_success:
-            raise RuntimeError(f"Failed to upload encoded chunk {chunk_index}")
+        if not source_url:
+            raise RuntimeError(f"Failed to presign video {video_id}")
+        
+        # Step 2: Decode once, encode every rendition into segments
+        watermark_filter = None
+        if watermark_text and watermark_text.strip():
+            watermark_filter = build_watermark_filter(
+                text=watermark_text.strip(),
+                position=watermark_position,
+                font_size=watermark_font_size,
+                opacity=watermark_opacity
+            )
+        
+        # One NVENC session per rendition; too many falls back to libx264
+        use_nvenc = use_nvenc_for(len(resolutions))
+        encoder = "h264_nvenc" if use_nvenc else "libx264"
+        
+        output_dirs = []
+        for resolution in resolutions:
+            output_dir = os.path.join(temp_dir, resolution)
+            os.makedirs(output_dir)
+            output_dirs.append(output_dir)
+        
+        segment_list_path = os.path.join(temp_dir, "segments.csv")
+        
+        cmd = build_fused_transcode_command(
+            input_path=source_url,
+            output_patterns=[os.path.join(d, "seg_%04d.ts") for d in output_dirs],
+            heights=[RESOLUTION_CONFIG[r]["height"] for r in resolutions],
+            watermark_filter=watermark_filter,
+            chunk_duration=chunk_duration,
+            use_nvenc=use_nvenc,
+            segment_list_path=segment_list_path
+        )
+        
+        activity.logger.info(f"[{video_id}] Running fused ffmpeg with {encoder}")
+        
+        # Hold one NVENC session per encoder this process opens
+        async with nvenc_sessions(len(resolutions) if use_nvenc else 0):
+            process = await run_process(cmd, timeout=600)
+        
+        if process.returncode != 0:
+            activity.logger.error(f"[{video_id}] Fused ffmpeg failed: {process.stderr[-500:]}")
+            raise RuntimeError(f"Fused ffmpeg failed: {process.stderr[-200:]}")
+        
+        # Step 3: Every rendition must have the same segment count for the playlists
+        segments_by_resolution = {
+            resolution: sorted(Path(output_dir).glob("seg_*.ts"))
+            for resolution, output_dir in zip(resolutions, output_dirs)
+        }
+        counts = {res: len(files) for res, files in segments_by_resolution.items()}
+        if len(set(counts.values())) != 1 or not any(counts.values()):
+            raise RuntimeError(f"Inconsistent segment counts across resolutions: {counts}")
+        
+        chunk_count = counts[resolutions[0]]
+        
+        # Real segment lengths for EXTINF (the last one is usually shorter)
+        with open(segment_list_path, newline="") as f:
+            segment_durations = [
+                float(end_time) - float(start_time)
+                for _, start_time, end_time in (row for row in csv.reader(f) if row)
+            ]
+        if len(segment_durations) != chunk_count:
+            raise RuntimeError(
+                f"Segment list has {len(segment_durations)} entries, expected {chunk_count}"
+            )
+        
+        # Step 4: Upload segments
+        activity.logger.info(
+            f"[{video_id}] Uploading {chunk_count} segments × {len(resolutions)} resolutions"
+        )
+        
+        def upload_one(item: tuple[str, int, Path]) -> None:
+            resolution, idx, segment_file = item
+            upload_success = storage.upload_file(
+                file_path=str(segment_file),
+                bucket_name="videos",
+                object_name=StoragePaths.output_segment(video_id, resolution, idx)
+            )
+            
+            if not upload_success:
+                raise RuntimeError(f"Failed to upload {resolution} segment {idx}")
         
-        output_size = os.path.getsize(temp_output_path)
-        input_size = os.path.getsize(temp_input_path)
+        uploads = [
+            (resolution, idx, segment_file)
+            for resolution, segment_files in segments_by_resolution.items()
+            for idx, segment_file in enumerate(segment_files)
+        ]
+        await run_transfers(upload_one, uploads)
         
         activity.logger.info(
-            f"[{video_id}] Chunk {chunk_index} -> {resolution} complete: "
-            f"{input_size / 1024:.1f}KB -> {output_size / 1024:.1f}KB"
-            + (f" (watermarked)" if has_watermark else "")
+            f"[{video_id}] Fused split+transcode complete: {chunk_count} segments × "
+            f"{len(resolutions)} resolutions ({encoder})"
         )
         
         return {
             "video_id": video_id,
-            "chunk_index": chunk_index,
-            "resolution": resolution,
-            "output_key": output_key,
-            "input_size_bytes": input_size,
-            "output_size_bytes": output_size,
-            "has_watermark": has_watermark,
+            "chunk_count": chunk_count,
+            "segment_durations": segment_durations,
+            "resolutions": resolutions,
+            "encoder": encoder,
             "success": True
         }
         
     except subprocess.TimeoutExpired:
-        activity.logger.error(f"[{video_id}] ffmpeg timeout for chunk {chunk_index}")
-        raise RuntimeError(f"ffmpeg timed out for chunk {chunk_index}")
+        activity.logger.error(f"[{video_id}] Fused ffmpeg timeout")
+        raise RuntimeError("Fused ffmpeg timed out")
     except Exception as e:
-        activity.logger.error(f"[{video_id}] Transcode chunk {chunk_index} failed: {e}")
+        activity.logger.error(f"[{video_id}] Fused split+transcode failed: {e}")
         raise
     finally:
-        # Cleanup
-        if temp_input_path and Path(temp_input_path).exists():
-            Path(temp_input_path).unlink()
-        if temp_output_path and Path(temp_output_path).exists():
-            Path(temp_output_path).unlink()
+        # Cleanup temp directory (ignore_errors covers a directory that was never populated)
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
 
 
 # HLS Configuration: Bandwidth estimates for adaptive bitrate selection
@@ -451,16 +1253,56 @@ HLS_BANDWIDTH = {
     "1080p": 5000000,  # 5 Mbps
 }
 
-# Default segment duration (should match split_video chunk_duration)
-HLS_SEGMENT_DURATION = 4
+def build_variant_playlist(segment_durations: list[float]) -> bytes:
+    """
+    Build the m3u8 body for a variant playlist.
+    
+    Purpose: Render one playlist body per video.
+    Consumers: generate_hls_playlist (one call per resolution).
+    Logic:
+      Segment paths are relative (segments/seg_XXXX.ts), and every resolution
+      is cut at the same points, so all variants of a video share the same
+      body. Each segment gets its real duration (keyframe-aligned chunks vary
+      in length) and TARGETDURATION is the longest one rounded up, as the HLS
+      spec requires.
+    
+    Args:
+        segment_durations: Duration of each segment in seconds, in order
+        
+    Returns:
+        UTF-8 encoded playlist content
+    """
+    target_duration = math.ceil(max(segment_durations, default=0))
+    
+    # HLS playlist format (version 3 for broad compatibility)
+    header = (
+        "#EXTM3U\n"
+        "#EXT-X-VERSION:3\n"
+        f"#EXT-X-TARGETDURATION:{target_duration}\n"
+        "#EXT-X-MEDIA-SEQUENCE:0\n"
+        "#EXT-X-PLAYLIST-TYPE:VOD\n"
+        "#EXT-X-ALLOW-CACHE:YES\n"
+    )
+    
+    # Each transcoded chunk has independent timestamps, so every segment after
+    # the first is preceded by a discontinuity tag (players expect a reset)
+    segments = [
+        ("#EXT-X-DISCONTINUITY\n" if idx else "")
+        + f"#EXTINF:{duration:.3f},\nsegments/seg_{idx:04d}.ts"
+        for idx, duration in enumerate(segment_durations)
+    ]
+    
+    # End of playlist marker (required for VOD)
+    segments.append("#EXT-X-ENDLIST")
+    
+    return (header + "\n".join(segments)).encode('utf-8')
 
 
 @activity.defn
 async def generate_hls_playlist(
     video_id: str,
     resolution: str,
-    chunk_count: int,
-    segment_duration: float = HLS_SEGMENT_DURATION
+    segment_durations: list[float]
 ) -> dict:
     """
     Generate HLS variant playlist (.m3u8) for a resolution.
@@ -475,15 +1317,15 @@ async def generate_hls_playlist(
       - Reduced storage (no duplicate merged files)
     
     Logic:
-      1. Verify all segments exist in MinIO
-      2. Generate m3u8 playlist content
+      1. Verify all segments exist in MinIO (single LIST of the segments prefix)
+      2. Build m3u8 playlist content with each segment's real duration
       3. Upload playlist to MinIO
     
     Args:
         video_id: Unique identifier for the video
         resolution: Target resolution (e.g., "720p")
-        chunk_count: Number of segments in the playlist
-        segment_duration: Duration of each segment in seconds
+        segment_durations: Duration of each segment in seconds (split_video
+            chunk durations, or split_and_transcode segment_durations)
         
     Returns:
         Dictionary with:
@@ -493,23 +1335,24 @@ async def generate_hls_playlist(
         - segment_count: int
         - success: bool
     """
+    chunk_count = len(segment_durations)
     activity.logger.info(
         f"[{video_id}] Generating HLS playlist for {resolution} ({chunk_count} segments)"
     )
     
-    storage = MinIOStorage()
+    storage = get_storage()
     
     try:
         # Step 1: Verify all segments exist
-        missing_segments = []
-        segment_keys = []
-        
-        for idx in range(chunk_count):
-            segment_key = StoragePaths.output_segment(video_id, resolution, idx)
-            segment_keys.append(segment_key)
-            
-            if not storage.file_exists("videos", segment_key):
-                missing_segments.append(idx)
+        # One LIST request replaces a HEAD request per segment
+        existing_keys = set(await asyncio.to_thread(
+            storage.list_objects,
+            "videos", prefix=StoragePaths.output_segments_prefix(video_id, resolution)
+        ))
+        missing_segments = [
+            idx for idx in range(chunk_count)
+            if StoragePaths.output_segment(video_id, resolution, idx) not in existing_keys
+        ]
         
         if missing_segments:
             raise RuntimeError(
@@ -519,39 +1362,15 @@ async def generate_hls_playlist(
         
         activity.logger.info(f"[{video_id}] Verified {chunk_count} segments exist")
         
-        # Step 2: Generate m3u8 playlist content
-        # HLS playlist format (version 3 for broad compatibility)
-        playlist_lines = [
-            "#EXTM3U",
-            "#EXT-X-VERSION:3",
-            f"#EXT-X-TARGETDURATION:{int(segment_duration) + 1}",
-            "#EXT-X-MEDIA-SEQUENCE:0",
-            "#EXT-X-PLAYLIST-TYPE:VOD",
-            "#EXT-X-ALLOW-CACHE:YES",
-        ]
-        
-        # Add each segment with discontinuity tags
-        # Each transcoded chunk has independent timestamps, so we mark discontinuities
-        for idx in range(chunk_count):
-            # Add discontinuity tag for each segment after the first
-            # This tells players to expect timestamp resets
-            if idx > 0:
-                playlist_lines.append("#EXT-X-DISCONTINUITY")
-            
-            segment_filename = f"segments/seg_{idx:04d}.ts"
-            playlist_lines.append(f"#EXTINF:{segment_duration:.3f},")
-            playlist_lines.append(segment_filename)
-        
-        # End of playlist marker (required for VOD)
-        playlist_lines.append("#EXT-X-ENDLIST")
-        
-        playlist_content = "\n".join(playlist_lines)
+        # Step 2: Build m3u8 playlist content
+        playlist_bytes = build_variant_playlist(segment_durations)
         
         # Step 3: Upload variant playlist
         playlist_key = StoragePaths.variant_playlist(video_id, resolution)
         
-        upload_success = storage.upload_fileobj(
-            file_data=playlist_content.encode('utf-8'),
+        upload_success = await asyncio.to_thread(
+            storage.upload_fileobj,
+            file_data=playlist_bytes,
             bucket_name="videos",
             object_name=playlist_key
         )
@@ -608,7 +1427,7 @@ async def generate_master_playlist(
         f"[{video_id}] Generating master playlist for {len(variants)} variants"
     )
     
-    storage = MinIOStorage()
+    storage = get_storage()
     
     try:
         # Build master playlist content
@@ -640,7 +1459,8 @@ async def generate_master_playlist(
         # Upload master playlist
         master_key = StoragePaths.master_playlist(video_id)
         
-        upload_success = storage.upload_fileobj(
+        upload_success = await asyncio.to_thread(
+            storage.upload_fileobj,
             file_data=playlist_content.encode('utf-8'),
             bucket_name="videos",
             object_name=master_key
@@ -674,8 +1494,9 @@ async def cleanup_source_chunks(video_id: str, chunk_count: int) -> dict:
     Purpose: Free storage by removing intermediate files.
     Consumers: Workflow orchestrator after all renditions complete.
     Logic:
-      1. Delete all source chunks from MinIO
-      2. Delete source manifest
+      1. Delete all source chunks and the source manifest from MinIO with
+         multi-object DELETE (one request per 1000 keys instead of one per chunk)
+      2. Report keys that failed to delete
     
     Args:
         video_id: Unique identifier for the video
@@ -686,19 +1507,26 @@ async def cleanup_source_chunks(video_id: str, chunk_count: int) -> dict:
     """
     activity.logger.info(f"[{video_id}] Cleaning up {chunk_count} source chunks")
     
-    storage = MinIOStorage()
+    storage = get_storage()
     deleted = 0
     
     try:
-        # Delete source chunks
-        for idx in range(chunk_count):
-            chunk_key = StoragePaths.source_chunk(video_id, idx)
-            if storage.delete_file("videos", chunk_key):
-                deleted += 1
-        
-        # Delete source manifest
+        chunk_keys = [StoragePaths.source_chunk(video_id, idx) for idx in range(chunk_count)]
         manifest_key = StoragePaths.source_manifest(video_id)
-        storage.delete_file("videos", manifest_key)
+        
+        failed_keys = await asyncio.to_thread(storage.delete_files, "videos", chunk_keys + [manifest_key])
+        deleted = len(set(chunk_keys) - set(failed_keys))
+        
+        if failed_keys:
+            activity.logger.warning(
+                f"[{video_id}] Cleanup partially failed: {len(failed_keys)} objects not deleted"
+            )
+            return {
+                "video_id": video_id,
+                "chunks_deleted": deleted,
+                "success": False,
+                "error": f"Failed to delete: {failed_keys[:10]}"
+            }
         
         activity.logger.info(f"[{video_id}] Cleanup complete: {deleted} chunks deleted")
         
@@ -721,7 +1549,8 @@ async def cleanup_source_chunks(video_id: str, chunk_count: int) -> dict:
 # Export all activity functions
 __all__ = [
     "split_video",
-    "transcode_chunk",
+    "transcode_chunk_multi",
+    "split_and_transcode",
     "generate_hls_playlist",
     "generate_master_playlist",
     "cleanup_source_chunks",
@@ -5,19 +5,146 @@ Purpose: Download YouTube videos and upload to MinIO storage.
 Consumers: Download workers polling 'download-queue'.
 Logic:
   1. Validate YouTube URL
-  2. Download video using yt-dlp (best quality up to 1080p)
-  3. Upload to MinIO videos bucket
-  4. Return video metadata for downstream processing
+  2. Resolve the best format up to 1080p with yt-dlp
+  3. Single-file formats: pipe yt-dlp stdout straight into a MinIO multipart
+     upload (network -> MinIO, no disk round trip)
+  4. Formats needing a video+audio merge: download to disk (the mp4 muxer
+     needs a seekable output) and multipart-upload from disk
+  5. Return video metadata for downstream processing
+yt-dlp and the uploads are blocking, so they run in worker threads
+(asyncio.to_thread) and never stall the worker's event loop.
 """
+import asyncio
 import os
 import logging
 import tempfile
+import subprocess
 import yt_dlp
 from temporalio import activity
-from shared.storage import MinIOStorage
+from shared.storage import get_storage, StoragePaths
+from worker.activities.process import run_process_streaming
 
 logger = logging.getLogger(__name__)
 
+# Best quality up to 1080p; the first alternative needs a video+audio merge
+YTDLP_FORMAT = 'bestvideo[height<=1080][ext=mp4]+bestaudio[ext=m4a]/best[height<=1080][ext=mp4]/best'
+
+# Matches the workflow's start_to_close_timeout for the download activity
+DOWNLOAD_TIMEOUT = 600
+
+# Shared by resolution and download so the resolved info stays valid for both
+YTDLP_BASE_OPTS = {
+    'format': YTDLP_FORMAT,
+    'merge_output_format': 'mp4',
+    'quiet': True,
+    'no_warnings': True,
+}
+
+
+def extract_info(youtube_url: str) -> dict:
+    """
+    Resolve video metadata and the selected format without downloading.
+    
+    Args:
+        youtube_url: YouTube video URL
+        
+    Returns:
+        yt-dlp info dict (requested_formats is set when a merge is needed)
+    """
+    with yt_dlp.YoutubeDL(YTDLP_BASE_OPTS) as ydl:
+        return ydl.extract_info(youtube_url, download=False)
+
+
+async def stream_to_storage(video_id: str, youtube_url: str, format_id: str) -> int:
+    """
+    Pipe a single-file yt-dlp download directly into MinIO.
+    
+    Purpose: Avoid writing the source to local disk when no merge is needed.
+    Consumers: download_youtube_video.
+    Logic:
+      1. Run yt-dlp with output to stdout for the already-resolved format
+      2. Multipart-upload the pipe to MinIO as bytes arrive
+      3. Fail if yt-dlp exits non-zero or the upload fails (only the last
+         stderr lines are kept, so memory stays bounded however chatty it is)
+    yt-dlp is killed if the activity is cancelled mid-download.
+    
+    Args:
+        video_id: Unique identifier for the video
+        youtube_url: YouTube video URL
+        format_id: yt-dlp format id selected by extract_info
+        
+    Returns:
+        Size of the uploaded object in bytes
+    """
+    storage = get_storage()
+    object_name = StoragePaths.source_video(video_id)
+    
+    try:
+        proc, upload_success = await run_process_streaming(
+            ["yt-dlp", "-f", format_id, "-o", "-", "--quiet", "--no-warnings", youtube_url],
+            lambda stdout: storage.upload_stream(stdout, "videos", object_name),
+            DOWNLOAD_TIMEOUT
+        )
+    except subprocess.TimeoutExpired:
+        raise Exception(f"yt-dlp timed out after {DOWNLOAD_TIMEOUT}s")
+    
+    if proc.returncode != 0:
+        raise Exception(f"yt-dlp failed: {proc.stderr[-500:]}")
+    if not upload_success:
+        raise Exception("Upload to MinIO failed")
+    
+    return await asyncio.to_thread(storage.get_object_size, "videos", object_name) or 0
+
+
+def download_and_upload(video_id: str, info: dict, storage) -> int:
+    """
+    Download a merged video+audio format to disk, then upload it to MinIO.
+    
+    Downloads from the info dict extract_info already resolved (the
+    download_with_info_file path), so the page and formats are not fetched
+    and resolved a second time.
+    
+    Args:
+        video_id: Unique identifier for the video
+        info: yt-dlp info dict from extract_info
+        storage: MinIOStorage instance
+        
+    Returns:
+        Size of the uploaded file in bytes
+    """
+    # Create temp directory for download
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_path = os.path.join(temp_dir, f"{video_id}.mp4")
+        
+        ydl_opts = {**YTDLP_BASE_OPTS, 'outtmpl': output_path}
+        
+        logger.info(f"[{video_id}] Downloading from YouTube...")
+        
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            ydl.process_ie_result(info, download=True)
+        
+        # Verify file exists
+        if not os.path.exists(output_path):
+            raise Exception("Downloaded file not found")
+        
+        file_size = os.path.getsize(output_path)
+        if file_size == 0:
+            raise Exception("Downloaded file is empty")
+        
+        # Upload to MinIO straight from disk (multipart, constant memory)
+        # Must happen inside the temp dir context before it is removed
+        logger.info(f"[{video_id}] Uploading to MinIO...")
+        upload_success = storage.upload_file(
+            file_path=output_path,
+            bucket_name="videos",
+            object_name=StoragePaths.source_video(video_id)
+        )
+        
+        if not upload_success:
+            raise Exception("Upload to MinIO failed")
+    
+    return file_size
+
 
 @activity.defn
 async def download_youtube_video(video_id: str, youtube_url: str) -> dict:
@@ -40,55 +167,23 @@ async def download_youtube_video(video_id: str, youtube_url: str) -> dict:
     """
     logger.info(f"[{video_id}] Starting YouTube download: {youtube_url}")
     
-    storage = MinIOStorage()
+    storage = get_storage()
     
     try:
-        # Create temp directory for download
-        with tempfile.TemporaryDirectory() as temp_dir:
-            output_path = os.path.join(temp_dir, f"{video_id}.mp4")
-            
-            # yt-dlp options - download best quality up to 1080p
-            ydl_opts = {
-                'format': 'bestvideo[height<=1080][ext=mp4]+bestaudio[ext=m4a]/best[height<=1080][ext=mp4]/best',
-                'outtmpl': output_path,
-                'merge_output_format': 'mp4',
-                'quiet': True,
-                'no_warnings': True,
-            }
-            
-            logger.info(f"[{video_id}] Downloading from YouTube...")
-            
-            # Download video
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(youtube_url, download=True)
-                video_title = info.get('title', 'Unknown')
-                duration = info.get('duration', 0)
-                
-            logger.info(f"[{video_id}] Downloaded: {video_title} ({duration}s)")
-            
-            # Verify file exists
-            if not os.path.exists(output_path):
-                raise Exception("Downloaded file not found")
-            
-            # Read downloaded file
-            with open(output_path, 'rb') as f:
-                file_content = f.read()
-            
-            if len(file_content) == 0:
-                raise Exception("Downloaded file is empty")
-            
-            file_size = len(file_content)
-            logger.info(f"[{video_id}] File size: {file_size} bytes ({file_size / 1024 / 1024:.2f} MB)")
+        info = await asyncio.to_thread(extract_info, youtube_url)
+        video_title = info.get('title', 'Unknown')
+        duration = info.get('duration', 0)
         
-        # Upload to MinIO with .mp4 extension
-        logger.info(f"[{video_id}] Uploading to MinIO...")
-        from shared.storage import StoragePaths
-        storage.upload_fileobj(
-            file_data=file_content,
-            bucket_name="videos",
-            object_name=StoragePaths.source_video(video_id)
-        )
+        if not info.get('requested_formats'):
+            # Single file, no merge: stream network -> MinIO without touching disk
+            logger.info(f"[{video_id}] Streaming from YouTube to MinIO: {video_title} ({duration}s)")
+            file_size = await stream_to_storage(video_id, youtube_url, info['format_id'])
+            if file_size == 0:
+                raise Exception("Downloaded file is empty")
+        else:
+            file_size = await asyncio.to_thread(download_and_upload, video_id, info, storage)
         
+        logger.info(f"[{video_id}] File size: {file_size} bytes ({file_size / 1024 / 1024:.2f} MB)")
         logger.info(f"[{video_id}] Upload complete")
         
         return {
@@ -1,19 +1,70 @@
 """
 Metadata extraction activity
-Fast, I/O-bound operations for extracting video metadata using ffprobe
+Fast, I/O-bound operations for extracting video metadata: MP4 sources are
+parsed in pure Python from ranged reads of the moov box (no subprocess);
+anything else falls back to ffprobe on a presigned MinIO URL (no full download)
 """
-import json
+import asyncio
 import subprocess
-import tempfile
-from pathlib import Path
+import orjson
 from temporalio import activity
-from shared.storage import MinIOStorage
+from shared.storage import get_storage, StoragePaths
+from worker.activities.mp4_probe import probe_mp4
+from worker.activities.process import run_process
+
+
+async def probe_duration(video_id: str, video_url: str) -> float:
+    """
+    Probe only the duration of a source video.
+    
+    Purpose: Fallback for activities invoked without the workflow's metadata.
+    Consumers: detect_scenes (when video_duration is not passed in).
+    Logic:
+        1. Parse the MP4 moov header from ranged reads (no subprocess)
+        2. Otherwise run a single ffprobe on the presigned URL, printing just
+           format.duration as bare CSV
+    
+    Args:
+        video_id: Unique identifier for the video in MinIO
+        video_url: Presigned URL of the source (used by the ffprobe fallback)
+        
+    Returns:
+        Duration in seconds
+        
+    Raises:
+        RuntimeError: If the duration could not be determined
+    """
+    storage = get_storage()
+    object_name = StoragePaths.source_video(video_id)
+    
+    def read_range(offset: int, length: int) -> tuple:
+        return storage.get_object_range("videos", object_name, offset, length)
+    
+    probed = await asyncio.to_thread(probe_mp4, read_range)
+    if probed is not None and probed["duration"]:
+        return probed["duration"]
+    
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "csv=p=0",
+        video_url
+    ]
+    result = await run_process(cmd, timeout=30)
+    try:
+        return float(result.stdout.strip())
+    except ValueError:
+        raise RuntimeError(f"Could not determine video duration: {result.stderr.strip()}")
 
 
 @activity.defn
 async def extract_metadata(video_id: str) -> dict:
     """
-    Extract video metadata using ffprobe
+    Extract video metadata from the container headers
+    
+    MP4/MOV sources are parsed directly from ranged reads of the moov box.
+    Other containers (or unparseable headers) fall back to ffprobe pointed at
+    a short-lived presigned URL, so only the bytes it needs are fetched.
     
     Args:
         video_id: Unique identifier for the video in MinIO
@@ -23,24 +74,33 @@ async def extract_metadata(video_id: str) -> dict:
     """
     activity.logger.info(f"Extracting metadata for video ID: {video_id}")
     
-    storage = MinIOStorage()
-    temp_video_path = None
+    storage = get_storage()
+    object_name = StoragePaths.source_video(video_id)
     
     try:
-        # Download video from MinIO
-        from shared.storage import StoragePaths
-        activity.logger.info(f"Downloading video {video_id} from MinIO")
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tmp_file:
-            temp_video_path = tmp_file.name
+        # Fast path: pure-Python moov parse, ~1-3 small range requests
+        def read_range(offset: int, length: int) -> tuple:
+            return storage.get_object_range("videos", object_name, offset, length)
+        
+        probed = await asyncio.to_thread(probe_mp4, read_range)
+        if probed is not None:
+            metadata = {"video_id": video_id, **probed}
+            activity.logger.info(f"Successfully extracted metadata for {video_id} (mp4 header): {metadata}")
+            return metadata
         
-        success = storage.download_file(
+        activity.logger.info(f"[{video_id}] Not a parseable MP4 header, falling back to ffprobe")
+        
+        # Presigned GET URL lets ffprobe read the source over HTTP: it issues
+        # range requests for the container header/moov atom only, instead of
+        # the whole video being downloaded first
+        video_url = storage.get_object_url(
             bucket_name="videos",
-            object_name=StoragePaths.source_video(video_id),
-            file_path=temp_video_path
+            object_name=object_name,
+            expiration=300
         )
         
-        if not success:
-            raise RuntimeError(f"Failed to download video {video_id} from MinIO")
+        if not video_url:
+            raise RuntimeError(f"Failed to generate presigned URL for video {video_id}")
         
         # Run ffprobe command
         cmd = [
@@ -49,21 +109,17 @@ async def extract_metadata(video_id: str) -> dict:
             "-show_format",
             "-show_streams",
             "-print_format", "json",
-            temp_video_path
+            video_url
         ]
         
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
+        # Raw bytes: orjson parses them directly, no UTF-8 decode pass
+        result = await run_process(cmd, timeout=60, text=False)
         
         if result.returncode != 0:
-            raise RuntimeError(f"ffprobe failed: {result.stderr}")
+            raise RuntimeError(f"ffprobe failed: {result.stderr.decode(errors='replace')}")
         
         # Parse ffprobe output
-        ffprobe_data = json.loads(result.stdout)
+        ffprobe_data = orjson.loads(result.stdout)
         
         # Extract key metadata
         metadata = {
@@ -76,6 +132,7 @@ async def extract_metadata(video_id: str) -> dict:
             "audio_codec": None,
             "bit_rate": None,
             "format": None,
+            "size_bytes": None,
         }
         
         # Extract format information
@@ -84,6 +141,7 @@ async def extract_metadata(video_id: str) -> dict:
             metadata["duration"] = float(format_info.get("duration", 0))
             metadata["bit_rate"] = int(format_info.get("bit_rate", 0))
             metadata["format"] = format_info.get("format_name")
+            metadata["size_bytes"] = int(format_info.get("size", 0))
         
         # Extract stream information
         if "streams" in ffprobe_data:
@@ -115,17 +173,12 @@ async def extract_metadata(video_id: str) -> dict:
     except subprocess.TimeoutExpired:
         activity.logger.error(f"ffprobe timeout for video {video_id}")
         raise RuntimeError("ffprobe execution timed out")
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         activity.logger.error(f"Failed to parse ffprobe output: {e}")
         raise
     except Exception as e:
         activity.logger.error(f"Error extracting metadata for {video_id}: {e}")
         raise
-    finally:
-        # Clean up temporary file
-        if temp_video_path and Path(temp_video_path).exists():
-            Path(temp_video_path).unlink()
-            activity.logger.info(f"Cleaned up temporary file: {temp_video_path}")
 
 
-__all__ = ["extract_metadata"]
+__all__ = ["extract_metadata", "probe_duration"]
